@@ -40,6 +40,85 @@ args_parser.parser.add_argument("--always-download-new-model", action='store_tru
 args_parser.parser.add_argument("--rebuild-hash-cache", help="Generates missing model and LoRA hashes.",
                                 type=int, nargs="?", metavar="CPU_NUM_THREADS", const=-1)
 
+args_parser.parser.add_argument("--watch-model-folders", action='store_true',
+                                help="Refresh the model, LoRA, VAE and wildcard lists when files change "
+                                  "(requires inotify_simple, Linux only).")
+
+args_parser.parser.add_argument("--worker-pool-size", type=int, default=1, metavar="NUM_WORKERS",
+                                help="Run generation tasks in this many worker processes, each with its own models.")
+
+args_parser.parser.add_argument("--worker-pool-devices", type=str, default=None, metavar="DEVICES",
+                                help="Comma separated CUDA device ids (or 'cpu') assigned round-robin to the "
+                                  "worker processes, e.g. [--worker-pool-devices 0,1].")
+
+args_parser.parser.add_argument("--task-scheduler", type=str, default='fifo', choices=['fifo', 'affinity'],
+                                help="Order of queued tasks. 'affinity' runs tasks using the currently loaded "
+                                  "models first to avoid model reloads.")
+
+args_parser.parser.add_argument("--task-scheduler-window", type=int, default=4, metavar="NUM_TASKS",
+                                help="Maximum number of times a queued task may be overtaken by the affinity scheduler.")
+
+args_parser.parser.add_argument("--checkpoint-cache-size", type=float, default=0, metavar="GIGABYTES",
+                                help="Keep recently used checkpoints in RAM up to this size so switching back "
+                                  "to them does not read them from disk again. 0 disables the cache.")
+
+args_parser.parser.add_argument("--checkpoint-cache-pin-memory", action='store_true',
+                                help="Pin the RAM of cached checkpoints for faster transfers to the GPU.")
+
+args_parser.parser.add_argument("--lora-cache-size", type=float, default=1.0, metavar="GIGABYTES",
+                                help="Keep parsed LoRA files in RAM up to this size so changing LoRA weights "
+                                  "does not reload them. 0 disables the cache.")
+
+args_parser.parser.add_argument("--incremental-weight-patching", action='store_true',
+                                help="Keep LoRA-patched weights between loads and only recompute the keys whose "
+                                  "patches changed. Keeps a backup of the original weights in RAM.")
+
+args_parser.parser.add_argument("--clip-cache-size", type=float, default=256, metavar="MEGABYTES",
+                                help="Size of the in-memory cache of encoded prompts, shared across model refreshes.")
+
+args_parser.parser.add_argument("--clip-cache-path", type=str, default=None, metavar="PATH",
+                                help="Also keep encoded prompts on disk in this folder so they survive restarts.")
+
+args_parser.parser.add_argument("--preprocess-cache-size", type=float, default=256, metavar="MEGABYTES",
+                                help="Size of the in-memory cache of ControlNet hints and IP-Adapter conditions, "
+                                  "keyed by the content of the input image. 0 disables the cache.")
+
+args_parser.parser.add_argument("--preprocess-cache-path", type=str, default=None, metavar="PATH",
+                                help="Also keep preprocessed ControlNet and IP-Adapter inputs on disk in this folder.")
+
+args_parser.parser.add_argument("--diffusion-batch-size", type=int, default=1, metavar="NUM_IMAGES",
+                                help="Sample up to this many images of a task in one UNet batch when the sampler "
+                                  "allows it. Seeds produce the same noise as when sampled one by one.")
+
+args_parser.parser.add_argument("--image-writer-threads", type=int, default=2, metavar="NUM_THREADS",
+                                help="Encode and save images on this many background threads. 0 saves on the "
+                                  "generation thread.")
+
+args_parser.parser.add_argument("--image-writer-queue-size", type=int, default=8, metavar="NUM_IMAGES",
+                                help="Maximum number of images waiting to be saved before generation pauses.")
+
+args_parser.parser.add_argument("--preview-max-fps", type=float, default=10, metavar="FPS",
+                                help="Decode sampling previews at most this often. 0 removes the limit.")
+
+args_parser.parser.add_argument("--preview-max-size", type=int, default=0, metavar="PIXELS",
+                                help="Downscale sampling previews to at most this many pixels on the longest side. "
+                                  "0 keeps the full size.")
+
+args_parser.parser.add_argument("--inpaint-fill", type=str, default='blur', choices=['blur', 'pyramid'],
+                                help="How the masked area is pre-filled before inpainting. 'pyramid' runs the "
+                                  "same blurs on downscaled copies, several times faster with a very close result.")
+
+args_parser.parser.add_argument("--sam-model-cache-size", type=int, default=1, metavar="NUM_MODELS",
+                                help="Number of SAM models kept loaded between mask generations. 0 loads the model "
+                                  "on every call.")
+
+args_parser.parser.add_argument("--sam-embedding-cache-size", type=float, default=64, metavar="MEGABYTES",
+                                help="Size of the cache of SAM image embeddings, so masks for several prompts on the "
+                                  "same image run the image encoder once. 0 disables the cache.")
+
+args_parser.parser.add_argument("--upscale-fp16", action='store_true',
+                                help="Run the ESRGAN upscaler in half precision when the device supports it.")
+
 args_parser.parser.set_defaults(
     disable_cuda_malloc=True,
     in_browser=True,
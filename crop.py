@@ -251,13 +251,19 @@ def save_composition_action(image, file_type, save_dir):
 # Background Removal Function (Tab 3)
 # -------------------------------------------
 def remove_bg_from_image(image, torchscript_mode, threshold):
+    import torch
     from transparent_background import Remover
+    from modules.session_pool import background_removal_sessions
     if image is None:
         return None, None
     if image.mode != "RGB":
         image = image.convert("RGB")
-    remover = Remover(jit=(torchscript_mode == "on"))
-    rgba_image = remover.process(image, type="rgba", threshold=threshold)
+    jit = torchscript_mode == "on"
+    device = "cuda:0" if torch.cuda.is_available() else "cpu"
+    # the Remover (and its traced model in TorchScript mode) is kept between clicks
+    with background_removal_sessions.use(("transparent_background", jit, device),
+                                         lambda: Remover(jit=jit, device=device)) as remover:
+        rgba_image = remover.process(image, type="rgba", threshold=threshold)
     mask = rgba_image.getchannel("A")
     return rgba_image, mask
 
@@ -0,0 +1,71 @@
+import sys
+import time
+
+import cv2
+import numpy as np
+
+import extras.preprocessors as preprocessors
+
+# Compares extras.preprocessors.canny_pyramid with the previous implementation, which ran the pyramid
+# levels one after another, blended every color channel separately and computed each percentile of
+# norm255 in its own pass.
+#
+#   python experiments_canny_pyramid.py [image] [repeats]
+
+
+def pyramid_canny_color_reference(x, canny_low_threshold, canny_high_threshold):
+    H, W, C = x.shape
+    acc_edge = None
+
+    for k in [0.2, 0.3, 0.4, 0.5, 0.6, 0.7, 0.8, 0.9, 1.0]:
+        Hs, Ws = int(H * k), int(W * k)
+        small = cv2.resize(x, (Ws, Hs), interpolation=cv2.INTER_AREA)
+        edge = preprocessors.centered_canny_color(small, canny_low_threshold, canny_high_threshold)
+        if acc_edge is None:
+            acc_edge = edge
+        else:
+            acc_edge = cv2.resize(acc_edge, (edge.shape[1], edge.shape[0]), interpolation=cv2.INTER_LINEAR)
+            acc_edge = acc_edge * 0.75 + edge * 0.25
+
+    return acc_edge
+
+
+def canny_pyramid_reference(x, canny_low_threshold, canny_high_threshold):
+    result = np.sum(pyramid_canny_color_reference(x, canny_low_threshold, canny_high_threshold), axis=2)
+    v_min = np.percentile(result, 1)
+    v_max = np.percentile(result, 99)
+    result -= v_min
+    result /= v_max - v_min
+    return (result * 255.0).clip(0, 255).astype(np.uint8)
+
+
+def synthetic_image(size=2048, seed=0):
+    rng = np.random.default_rng(seed)
+    image = cv2.GaussianBlur((rng.random((size // 2, size // 2, 3)) * 255).astype(np.uint8), (0, 0), 3)
+    image = cv2.resize(image, (size, size), interpolation=cv2.INTER_CUBIC)
+    for _ in range(40):
+        center = (int(rng.integers(0, size)), int(rng.integers(0, size)))
+        color = tuple(int(c) for c in rng.integers(0, 255, 3))
+        cv2.circle(image, center, int(rng.integers(20, size // 5)), color, int(rng.integers(-1, 8)))
+    return image
+
+
+def benchmark(fn, repeats):
+    result = fn()
+    start = time.perf_counter()
+    for _ in range(repeats):
+        fn()
+    return (time.perf_counter() - start) / repeats, result
+
+
+if __name__ == '__main__':
+    image = cv2.imread(sys.argv[1]) if len(sys.argv) > 1 else synthetic_image()
+    repeats = int(sys.argv[2]) if len(sys.argv) > 2 else 3
+
+    for low, high in [(64, 128), (32, 96)]:
+        old_time, old = benchmark(lambda: canny_pyramid_reference(image, low, high), repeats)
+        new_time, new = benchmark(lambda: preprocessors.canny_pyramid(image, low, high), repeats)
+        difference = np.abs(old.astype(np.int16) - new.astype(np.int16))
+        print(f'{image.shape[1]}x{image.shape[0]}, thresholds {low}/{high}: reference {old_time:.3f}s, '
+              f'canny_pyramid {new_time:.3f}s ({old_time / new_time:.1f}x), '
+              f'max difference {difference.max()}, pixels differing {np.count_nonzero(difference)}')
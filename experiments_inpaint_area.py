@@ -0,0 +1,36 @@
+import time
+
+import numpy as np
+
+import modules.inpaint_worker as inpaint_worker
+from tests.test_inpaint_worker import compute_initial_abcd_reference, solve_abcd_reference
+
+# Times how InpaintWorker picks the interested area: the bounding box of the mask and the box grown
+# to the respective field. The previous implementations are the references of tests/test_inpaint_worker.py.
+#
+#   python experiments_inpaint_area.py
+
+
+def benchmark(fn, repeats=20):
+    start = time.perf_counter()
+    for _ in range(repeats):
+        result = fn()
+    return (time.perf_counter() - start) / repeats, result
+
+
+if __name__ == '__main__':
+    for size, mask_size in [(1024, 16), (2048, 16), (4096, 64)]:
+        mask = np.zeros((size, size), dtype=bool)
+        mask[size // 3:size // 3 + mask_size, size // 2:size // 2 + mask_size] = True
+
+        old_time, abcd = benchmark(lambda: compute_initial_abcd_reference(mask))
+        new_time, new_abcd = benchmark(lambda: inpaint_worker.compute_initial_abcd(mask))
+        assert abcd == new_abcd
+        print(f'{size}x{size} bounding box: np.where {old_time * 1000:.2f}ms, np.any {new_time * 1000:.2f}ms')
+
+        for k in [0.618, 0.999]:
+            old_time, box = benchmark(lambda: solve_abcd_reference(mask, *abcd, k))
+            new_time, new_box = benchmark(lambda: inpaint_worker.solve_abcd(mask, *abcd, k))
+            assert box == new_box
+            print(f'{size}x{size} respective field {k}: loop {old_time * 1000:.2f}ms, '
+                  f'closed form {new_time * 1000:.3f}ms ({old_time / new_time:.0f}x)')
@@ -0,0 +1,45 @@
+import sys
+import time
+
+import cv2
+import numpy as np
+
+import modules.inpaint_worker as inpaint_worker
+
+# Compares the 'pyramid' fill of modules.inpaint_worker.fooocus_fill with the full size 'blur' fill.
+# The mask is an ellipse and a rectangle unless an image and a mask (white = inpaint) are given.
+#
+#   python experiments_inpaint_fill.py [image mask]
+
+
+def synthetic_inputs(size, seed=0):
+    rng = np.random.default_rng(seed)
+    image = cv2.resize((rng.random((16, 16, 3)) * 255).astype(np.uint8), (size, size), interpolation=cv2.INTER_CUBIC)
+    image = cv2.add(image, (rng.random((size, size, 3)) * 40).astype(np.uint8))
+    mask = np.zeros((size, size), dtype=np.uint8)
+    cv2.ellipse(mask, (size // 2, size // 2), (size // 3, size // 5), 30, 0, 360, 255, -1)
+    cv2.rectangle(mask, (size // 8, size // 8), (size // 4, size // 2), 255, -1)
+    return image, mask
+
+
+def benchmark(method, image, mask):
+    start = time.perf_counter()
+    result = inpaint_worker.fooocus_fill(image, mask, method=method)
+    return time.perf_counter() - start, result
+
+
+if __name__ == '__main__':
+    if len(sys.argv) > 2:
+        inputs = [(cv2.imread(sys.argv[1])[..., ::-1].copy(), cv2.imread(sys.argv[2], cv2.IMREAD_GRAYSCALE))]
+    else:
+        inputs = [synthetic_inputs(size) for size in [1024, 2048]]
+
+    for image, mask in inputs:
+        blur_time, blur = benchmark('blur', image, mask)
+        pyramid_time, pyramid = benchmark('pyramid', image, mask)
+        filled = mask >= 127
+        difference = np.abs(blur.astype(np.float64) - pyramid.astype(np.float64))[filled]
+        psnr = 10 * np.log10(255.0 ** 2 / max(np.mean(difference ** 2), 1e-10))
+        print(f'{image.shape[1]}x{image.shape[0]}: blur {blur_time:.2f}s, pyramid {pyramid_time:.2f}s '
+              f'({blur_time / pyramid_time:.1f}x), mean difference {difference.mean():.2f}, '
+              f'max difference {difference.max():.0f}, PSNR {psnr:.1f} dB')
@@ -0,0 +1,36 @@
+import os
+import subprocess
+import sys
+import time
+
+# Compares peak RSS and wall time of loading a checkpoint with the eager
+# safetensors.torch.load_file path and the lazy mmap backed state dict.
+# Every mode runs in a fresh process so the page cache is the only thing shared.
+#
+#   python experiments_lazy_loading.py models/checkpoints/juggernautXL_v8Rundiffusion.safetensors
+
+
+def run(ckpt, lazy):
+    import resource
+    import ldm_patched.modules.sd
+    import ldm_patched.modules.utils
+
+    if not lazy:
+        # force the old code path, everything is read by safetensors.torch.load_file
+        original = ldm_patched.modules.utils.load_torch_file
+        ldm_patched.modules.utils.load_torch_file = \
+            lambda path, safe_load=False, device=None, lazy=False: original(path, safe_load, device)
+
+    start = time.perf_counter()
+    ldm_patched.modules.sd.load_checkpoint_guess_config(ckpt)
+    elapsed = time.perf_counter() - start
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    print(f'{"lazy" if lazy else "eager"}: {elapsed:.2f} seconds, peak RSS {peak:.0f} MB')
+
+
+if __name__ == '__main__':
+    if len(sys.argv) > 2:
+        run(sys.argv[1], sys.argv[2] == 'lazy')
+    else:
+        for mode in ['eager', 'lazy']:
+            subprocess.run([sys.executable, os.path.abspath(__file__), sys.argv[1], mode], check=True)
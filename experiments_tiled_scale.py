@@ -0,0 +1,71 @@
+import sys
+import time
+
+import torch
+
+import ldm_patched.modules.utils
+
+# Compares ldm_patched.modules.utils.tiled_scale with the previous implementation, which built the
+# feather mask per tile in a Python loop and accumulated on the CPU. The model is a small conv
+# upscaler on the compute device so the tiling overhead is what is measured.
+#
+#   python experiments_tiled_scale.py [cuda|cpu] [tile batch size]
+
+
+@torch.inference_mode()
+def tiled_scale_reference(samples, function, tile_x=64, tile_y=64, overlap=8, upscale_amount=4, out_channels=3, output_device="cpu"):
+    output = torch.empty((samples.shape[0], out_channels, round(samples.shape[2] * upscale_amount), round(samples.shape[3] * upscale_amount)), device=output_device)
+    for b in range(samples.shape[0]):
+        s = samples[b:b+1]
+        out = torch.zeros((s.shape[0], out_channels, round(s.shape[2] * upscale_amount), round(s.shape[3] * upscale_amount)), device=output_device)
+        out_div = torch.zeros((s.shape[0], out_channels, round(s.shape[2] * upscale_amount), round(s.shape[3] * upscale_amount)), device=output_device)
+        for y in range(0, s.shape[2], tile_y - overlap):
+            for x in range(0, s.shape[3], tile_x - overlap):
+                s_in = s[:,:,y:y+tile_y,x:x+tile_x]
+
+                ps = function(s_in).to(output_device)
+                mask = torch.ones_like(ps)
+                feather = round(overlap * upscale_amount)
+                for t in range(feather):
+                        mask[:,:,t:1+t,:] *= ((1.0/feather) * (t + 1))
+                        mask[:,:,mask.shape[2] -1 -t: mask.shape[2]-t,:] *= ((1.0/feather) * (t + 1))
+                        mask[:,:,:,t:1+t] *= ((1.0/feather) * (t + 1))
+                        mask[:,:,:,mask.shape[3]- 1 - t: mask.shape[3]- t] *= ((1.0/feather) * (t + 1))
+                out[:,:,round(y*upscale_amount):round((y+tile_y)*upscale_amount),round(x*upscale_amount):round((x+tile_x)*upscale_amount)] += ps * mask
+                out_div[:,:,round(y*upscale_amount):round((y+tile_y)*upscale_amount),round(x*upscale_amount):round((x+tile_x)*upscale_amount)] += mask
+
+        output[b:b+1] = out/out_div
+    return output
+
+
+def benchmark(fn, device, repeats=3):
+    fn()
+    if device.type == 'cuda':
+        torch.cuda.synchronize()
+    start = time.perf_counter()
+    for _ in range(repeats):
+        result = fn()
+    if device.type == 'cuda':
+        torch.cuda.synchronize()
+    return (time.perf_counter() - start) / repeats, result
+
+
+if __name__ == '__main__':
+    device = torch.device(sys.argv[1] if len(sys.argv) > 1 else ('cuda' if torch.cuda.is_available() else 'cpu'))
+    tile_batch_size = int(sys.argv[2]) if len(sys.argv) > 2 else 4
+
+    model = torch.nn.Sequential(
+        torch.nn.Conv2d(3, 48, 3, padding=1),
+        torch.nn.PixelShuffle(4),
+        torch.nn.Conv2d(3, 3, 3, padding=1)).to(device).eval()
+    function = lambda a: model(a.to(device))
+
+    for size in [256, 512]:
+        samples = torch.rand(1, 3, size, size)
+        for tile, overlap in [(64, 8), (128, 16)]:
+            old_time, old = benchmark(lambda: tiled_scale_reference(samples, function, tile, tile, overlap), device)
+            new_time, new = benchmark(lambda: ldm_patched.modules.utils.tiled_scale(
+                samples, function, tile, tile, overlap, tile_batch_size=tile_batch_size), device)
+            print(f'{size}px, tile {tile}, overlap {overlap}: reference {old_time:.3f}s, '
+                  f'tiled_scale {new_time:.3f}s ({old_time / new_time:.1f}x), '
+                  f'max difference {(old - new).abs().max().item():.2e}')
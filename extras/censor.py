@@ -1,30 +1,40 @@
+import hashlib
+import json
 import os
 
 import numpy as np
 import torch
-from transformers import CLIPConfig, CLIPImageProcessor
+from transformers import CLIPConfig
 
 import ldm_patched.modules.model_management as model_management
 import modules.config
 from extras.safety_checker.models.safety_checker import StableDiffusionSafetyChecker
 from ldm_patched.modules.model_patcher import ModelPatcher
+from modules.model_cache import LRUCache
 
 safety_checker_repo_root = os.path.join(os.path.dirname(__file__), 'safety_checker')
 config_path = os.path.join(safety_checker_repo_root, "configs", "config.json")
 preprocessor_config_path = os.path.join(safety_checker_repo_root, "configs", "preprocessor_config.json")
 
 
+def image_hash(image):
+    return hashlib.blake2b(np.ascontiguousarray(image).data, digest_size=16).hexdigest() + str(image.shape)
+
+
 class Censor:
-    def __init__(self):
+    def __init__(self, cache_size=4096):
         self.safety_checker_model: ModelPatcher | None = None
-        self.clip_image_processor: CLIPImageProcessor | None = None
+        self.preprocessor_config = None
         self.load_device = torch.device('cpu')
         self.offload_device = torch.device('cpu')
+        # image hash -> has nsfw concept, every entry counts as one
+        self.verdicts = LRUCache(cache_size, lambda verdict: 1, name='Censor Cache')
 
     def init(self):
-        if self.safety_checker_model is None and self.clip_image_processor is None:
+        if self.safety_checker_model is None:
             safety_checker_model = modules.config.downloading_safety_checker_model()
-            self.clip_image_processor = CLIPImageProcessor.from_json_file(preprocessor_config_path)
+            with open(preprocessor_config_path, 'r', encoding='utf-8') as f:
+                self.preprocessor_config = json.load(f)
             clip_config = CLIPConfig.from_json_file(config_path)
             model = StableDiffusionSafetyChecker.from_pretrained(safety_checker_model, config=clip_config)
             model.eval()
@@ -36,20 +46,69 @@ class Censor:
 
             self.safety_checker_model = ModelPatcher(model, load_device=self.load_device, offload_device=self.offload_device)
 
-    def censor(self, images: list | np.ndarray) -> list | np.ndarray:
-        self.init()
-        model_management.load_model_gpu(self.safety_checker_model)
+    @torch.no_grad()
+    @torch.inference_mode()
+    def preprocess(self, images):
+        """Same steps as CLIPImageProcessor (shortest side resize, center crop, normalize) on batched tensors."""
+        config = self.preprocessor_config
+        size, crop_size = config['size'], config['crop_size']
+        mean = torch.tensor(config['image_mean'], device=self.load_device).view(1, 3, 1, 1)
+        std = torch.tensor(config['image_std'], device=self.load_device).view(1, 3, 1, 1)
+
+        # images of one shape are resized together, a batch from one task usually has a single shape
+        groups = {}
+        for index, image in enumerate(images):
+            groups.setdefault(image.shape, []).append(index)
+
+        pixel_values = [None] * len(images)
+        for (h, w, _), indices in groups.items():
+            x = torch.from_numpy(np.stack([images[i][..., :3] for i in indices])).to(self.load_device)
+            x = x.permute(0, 3, 1, 2).float() / 255.0
+            scale = size / min(h, w)
+            new_h, new_w = max(size, round(h * scale)), max(size, round(w * scale))
+            x = torch.nn.functional.interpolate(x, size=(new_h, new_w), mode='bicubic', antialias=True, align_corners=False)
+            top, left = (new_h - crop_size) // 2, (new_w - crop_size) // 2
+            x = x[:, :, top:top + crop_size, left:left + crop_size].clamp(0, 1)
+            x = (x - mean) / std
+            for i, index in enumerate(indices):
+                pixel_values[index] = x[i]
+
+        return torch.stack(pixel_values)
+
+    def check(self, images: list) -> list:
+        """Returns whether each image has an NSFW concept. Images that were checked before are not checked again."""
+        keys = [image_hash(image) for image in images]
+        verdicts = [self.verdicts.get(key) for key in keys]
+        unchecked = [i for i, verdict in enumerate(verdicts) if verdict is None]
+
+        if len(unchecked) > 0:
+            self.init()
+            model_management.load_model_gpu(self.safety_checker_model)
+
+            batch = [images[i] for i in unchecked]
+            clip_input = self.preprocess(batch).to(dtype=self.safety_checker_model.model.dtype)
+            # the checker blacks out images in place, hand it copies of the list
+            _, has_nsfw_concept = self.safety_checker_model.model(images=list(batch), clip_input=clip_input)
+
+            for i, nsfw in zip(unchecked, has_nsfw_concept):
+                verdicts[i] = bool(nsfw)
+                self.verdicts.put(keys[i], bool(nsfw))
+
+        return verdicts
 
+    def censor(self, images: list | np.ndarray) -> list | np.ndarray:
         single = False
-        if not isinstance(images, (list, np.ndarray)):
+        if not isinstance(images, (list, np.ndarray)) or isinstance(images, np.ndarray) and images.ndim == 3:
             images = [images]
             single = True
 
-        safety_checker_input = self.clip_image_processor(images, return_tensors="pt")
-        safety_checker_input.to(device=self.load_device)
-        checked_images, has_nsfw_concept = self.safety_checker_model.model(images=images,
-                                                                           clip_input=safety_checker_input.pixel_values)
-        checked_images = [image.astype(np.uint8) for image in checked_images]
+        checked_images = []
+        for image, nsfw in zip(images, self.check(list(images))):
+            if nsfw:
+                image = np.zeros(image.shape, dtype=np.uint8)
+                # a blacked out image is safe, censoring it again is free
+                self.verdicts.put(image_hash(image), False)
+            checked_images.append(image.astype(np.uint8))
 
         if single:
             checked_images = checked_images[0]
@@ -1,15 +1,42 @@
 import sys
+import threading
 
+import args_manager
+import ldm_patched.modules.model_management as model_management
 import modules.config
 import numpy as np
 import torch
 from extras.GroundingDINO.util.inference import default_groundingdino
 from extras.sam.predictor import SamPredictor
+from modules.core import tensors_size
+from modules.model_cache import LRUCache
+from modules.preprocess_cache import image_digest
+from modules.session_pool import background_removal_sessions
 from rembg import remove, new_session
 from segment_anything import sam_model_registry
 from segment_anything.utils.amg import remove_small_regions
 
 
+def release_sam_predictor(key, predictor):
+    print(f'[SAM Cache] Evicted {key}')
+    model_management.unload_model_clones(predictor.patcher)
+    model_management.soft_empty_cache()
+
+
+# SAM predictors by checkpoint, every entry counts as one. The weights stay on the offload device
+# between calls and model_management moves them to the GPU and back like any other model.
+sam_predictors = LRUCache(args_manager.args.sam_model_cache_size, lambda predictor: 1,
+                          on_evict=release_sam_predictor, name='SAM Cache')
+
+# image encoder outputs by (checkpoint, image content) as (features, original size, input size), so
+# masks for several prompts on the same image run the encoder once
+sam_embeddings = LRUCache(int(args_manager.args.sam_embedding_cache_size * 1024 ** 2),
+                          lambda entry: tensors_size(entry[0]), name='SAM Embedding Cache')
+
+# the predictor keeps the current image, the UI and the worker must not use it at the same time
+sam_lock = threading.Lock()
+
+
 class SAMOptions:
     def __init__(self,
                  # GroundingDINO
@@ -43,6 +70,30 @@ def optimize_masks(masks: torch.Tensor) -> torch.Tensor:
     return torch.from_numpy(masks)
 
 
+def get_sam_predictor(model_type):
+    sam_checkpoint = modules.config.download_sam_model(model_type)
+    predictor = sam_predictors.get(sam_checkpoint)
+    if predictor is None:
+        sam = sam_model_registry[model_type](checkpoint=sam_checkpoint)
+        predictor = SamPredictor(sam)
+        sam_predictors.put(sam_checkpoint, predictor)
+    return sam_checkpoint, predictor
+
+
+def set_sam_image(predictor, sam_checkpoint, image):
+    key = (sam_checkpoint, image_digest(image))
+    entry = sam_embeddings.get(key)
+    if entry is not None:
+        features, original_size, input_size = entry
+        predictor.set_image_embedding(features, original_size, input_size)
+        return
+
+    predictor.set_image(image)
+    if sam_embeddings.enabled:
+        features = predictor.get_image_embedding().to(predictor.offload_device)
+        sam_embeddings.put(key, (features, predictor.original_size, predictor.input_size))
+
+
 def generate_mask_from_image(image: np.ndarray, mask_model: str = 'sam', extras=None,
                              sam_options: SAMOptions | None = SAMOptions) -> tuple[np.ndarray | None, int | None, int | None, int | None]:
     dino_detection_count = 0
@@ -59,12 +110,14 @@ def generate_mask_from_image(image: np.ndarray, mask_model: str = 'sam', extras=
         image = image['image']
 
     if mask_model != 'sam' or sam_options is None:
-        result = remove(
-            image,
-            session=new_session(mask_model, **extras),
-            only_mask=True,
-            **extras
-        )
+        key = ('rembg', mask_model, tuple(sorted(extras.items())))
+        with background_removal_sessions.use(key, lambda: new_session(mask_model, **extras)) as session:
+            result = remove(
+                image,
+                session=session,
+                only_mask=True,
+                **extras
+            )
 
         return result, dino_detection_count, sam_detection_count, sam_detection_on_mask_count
 
@@ -80,16 +133,10 @@ def generate_mask_from_image(image: np.ndarray, mask_model: str = 'sam', extras=
     boxes[:, :2] = boxes[:, :2] - boxes[:, 2:] / 2
     boxes[:, 2:] = boxes[:, 2:] + boxes[:, :2]
 
-    sam_checkpoint = modules.config.download_sam_model(sam_options.model_type)
-    sam = sam_model_registry[sam_options.model_type](checkpoint=sam_checkpoint)
-
-    sam_predictor = SamPredictor(sam)
     final_mask_tensor = torch.zeros((image.shape[0], image.shape[1]))
     dino_detection_count = boxes.size(0)
 
     if dino_detection_count > 0:
-        sam_predictor.set_image(image)
-
         if sam_options.dino_erode_or_dilate != 0:
             for index in range(boxes.size(0)):
                 assert boxes.size(1) == 4
@@ -106,13 +153,18 @@ def generate_mask_from_image(image: np.ndarray, mask_model: str = 'sam', extras=
                 draw.rectangle(box.tolist(), fill="white")
             return np.array(debug_dino_image), dino_detection_count, sam_detection_count, sam_detection_on_mask_count
 
-        transformed_boxes = sam_predictor.transform.apply_boxes_torch(boxes, image.shape[:2])
-        masks, _, _ = sam_predictor.predict_torch(
-            point_coords=None,
-            point_labels=None,
-            boxes=transformed_boxes,
-            multimask_output=False,
-        )
+        with sam_lock:
+            sam_checkpoint, sam_predictor = get_sam_predictor(sam_options.model_type)
+            set_sam_image(sam_predictor, sam_checkpoint, image)
+
+            transformed_boxes = sam_predictor.transform.apply_boxes_torch(boxes, image.shape[:2])
+            masks, _, _ = sam_predictor.predict_torch(
+                point_coords=None,
+                point_labels=None,
+                boxes=transformed_boxes,
+                multimask_output=False,
+            )
+            sam_predictor.reset_image()
 
         masks = optimize_masks(masks)
         sam_detection_count = len(masks)
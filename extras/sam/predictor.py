@@ -101,6 +101,29 @@ class SamPredictor:
         self.features = self.patcher.model.image_encoder(input_image)
         self.is_image_set = True
 
+    def set_image_embedding(
+        self,
+        features: torch.Tensor,
+        original_image_size: Tuple[int, ...],
+        input_size: Tuple[int, ...],
+    ) -> None:
+        """
+        Sets image embeddings computed earlier by set_image or set_torch_image,
+        skipping the image encoder.
+
+        Arguments:
+          features (torch.Tensor): The embeddings, as returned by get_image_embedding.
+          original_image_size (tuple(int, int)): The size of the image before
+            transformation, in (H, W) format.
+          input_size (tuple(int, int)): The size of the transformed image, in (H, W) format.
+        """
+        self.reset_image()
+
+        self.original_size = original_image_size
+        self.input_size = input_size
+        self.features = features.to(self.load_device)
+        self.is_image_set = True
+
     def predict(
         self,
         point_coords: Optional[np.ndarray] = None,
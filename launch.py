@@ -147,6 +147,8 @@ config.default_base_model_name, config.checkpoint_downloads = download_models(
     config.embeddings_downloads, config.lora_downloads, config.vae_downloads)
 
 config.update_files()
+if args.watch_model_folders:
+    config.start_file_watcher()
 init_cache(config.model_filenames, config.paths_checkpoints, config.lora_filenames, config.paths_loras)
 
 from webui import *
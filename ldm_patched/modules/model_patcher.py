@@ -1,9 +1,14 @@
 import torch
 import copy
 import inspect
+import time
 
 import ldm_patched.modules.utils
 import ldm_patched.modules.model_management
+from ldm_patched.modules.args_parser import args
+
+#number of weights moved to the target device before their patches are calculated
+PATCH_TRANSFER_BATCH = 8
 
 class ModelPatcher:
     def __init__(self, model, load_device, offload_device, size=0, current_device=None, weight_inplace_update=False):
@@ -23,6 +28,9 @@ class ModelPatcher:
             self.current_device = current_device
 
         self.weight_inplace_update = weight_inplace_update
+        self.incremental_patching = getattr(args, "incremental_weight_patching", False)
+        self.last_patch_time = 0.0
+        self.last_patched_keys = []
 
     def model_size(self):
         if self.size > 0:
@@ -41,6 +49,7 @@ class ModelPatcher:
         n.object_patches = self.object_patches.copy()
         n.model_options = copy.deepcopy(self.model_options)
         n.model_keys = self.model_keys
+        n.incremental_patching = self.incremental_patching
         return n
 
     def is_clone(self, other):
@@ -153,6 +162,7 @@ class ModelPatcher:
 
     def get_key_patches(self, filter_prefix=None):
         ldm_patched.modules.model_management.unload_model_clones(self)
+        self.restore_weights()
         model_sd = self.model_state_dict()
         p = {}
         for k in model_sd:
@@ -182,36 +192,102 @@ class ModelPatcher:
             setattr(self.model, k, self.object_patches[k])
 
         if patch_weights:
+            start = time.perf_counter()
             model_sd = self.model_state_dict()
-            for key in self.patches:
-                if key not in model_sd:
-                    print("could not patch. key doesn't exist in model:", key)
-                    continue
-
-                weight = model_sd[key]
 
-                inplace_update = self.weight_inplace_update
-
-                if key not in self.backup:
-                    self.backup[key] = weight.to(device=self.offload_device, copy=inplace_update)
+            if self.incremental_patching:
+                keys = self.changed_patch_keys(model_sd)
+            else:
+                keys = list(self.patches.keys())
 
-                if device_to is not None:
-                    temp_weight = ldm_patched.modules.model_management.cast_to_device(weight, device_to, torch.float32, copy=True)
-                else:
-                    temp_weight = weight.to(torch.float32, copy=True)
-                out_weight = self.calculate_weight(self.patches[key], temp_weight, key).to(weight.dtype)
-                if inplace_update:
-                    ldm_patched.modules.utils.copy_to_param(self.model, key, out_weight)
-                else:
-                    ldm_patched.modules.utils.set_attr(self.model, key, out_weight)
-                del temp_weight
+            for i in range(0, len(keys), PATCH_TRANSFER_BATCH):
+                self.patch_weights(keys[i:i + PATCH_TRANSFER_BATCH], model_sd, device_to)
 
             if device_to is not None:
                 self.model.to(device_to)
                 self.current_device = device_to
 
+            self.last_patched_keys = keys
+            self.last_patch_time = time.perf_counter() - start
+            if self.incremental_patching and len(self.patches) > 0:
+                print(f"[Model Patcher] Patched {len(keys)} of {len(self.patches)} keys "
+                      f"in {self.last_patch_time:.2f} seconds.")
+
         return self.model
 
+    def patch_weights(self, keys, model_sd, device_to):
+        #issue all transfers of the batch first so copies to the device can overlap
+        temp_weights = {}
+        for key in keys:
+            if key not in model_sd:
+                print("could not patch. key doesn't exist in model:", key)
+                continue
+
+            weight = model_sd[key]
+
+            inplace_update = self.weight_inplace_update
+
+            if key not in self.backup:
+                self.backup[key] = weight.to(device=self.offload_device, copy=inplace_update)
+
+            if self.incremental_patching:
+                #the module may still carry weights patched for another clone, start from the original
+                weight = self.backup[key]
+
+            if device_to is not None:
+                temp_weights[key] = ldm_patched.modules.model_management.cast_to_device(weight, device_to, torch.float32, copy=True)
+            else:
+                temp_weights[key] = weight.to(model_sd[key].device, torch.float32, copy=True)
+
+        for key, temp_weight in temp_weights.items():
+            out_weight = self.calculate_weight(self.patches[key], temp_weight, key).to(model_sd[key].dtype)
+            if self.weight_inplace_update:
+                ldm_patched.modules.utils.copy_to_param(self.model, key, out_weight)
+            else:
+                ldm_patched.modules.utils.set_attr(self.model, key, out_weight)
+            if self.incremental_patching:
+                self.model.fcs_applied_patches[key] = self.patches[key][:]
+
+    def changed_patch_keys(self, model_sd):
+        #backup and the record of applied patches live on the module so that they are shared by all clones
+        if not hasattr(self.model, "fcs_applied_patches"):
+            self.model.fcs_applied_patches = {}
+            self.model.fcs_weight_backup = {}
+        self.backup = self.model.fcs_weight_backup
+        applied = self.model.fcs_applied_patches
+
+        for key in list(applied.keys()):
+            if key not in self.patches:
+                self.restore_weight(key, model_sd[key].device)
+                del applied[key]
+
+        changed = []
+        for key, patches in self.patches.items():
+            previous = applied.get(key)
+            if previous is None or len(previous) != len(patches) or any(
+                    a[0] != b[0] or a[1] is not b[1] or a[2] != b[2] for a, b in zip(previous, patches)):
+                changed.append(key)
+        return changed
+
+    def restore_weight(self, key, device):
+        weight = self.backup[key]
+        if self.weight_inplace_update:
+            ldm_patched.modules.utils.copy_to_param(self.model, key, weight)
+        else:
+            ldm_patched.modules.utils.set_attr(self.model, key, weight.to(device, copy=True))
+
+    def restore_weights(self):
+        applied = getattr(self.model, "fcs_applied_patches", None)
+        if not applied:
+            return
+        self.backup = self.model.fcs_weight_backup
+        model_sd = self.model_state_dict()
+        for key in list(applied.keys()):
+            self.restore_weight(key, model_sd[key].device)
+        applied.clear()
+        self.backup.clear()
+        self.backup = {}
+
     def calculate_weight(self, patches, weight, key):
         for p in patches:
             alpha = p[0]
@@ -335,7 +411,11 @@ class ModelPatcher:
         return weight
 
     def unpatch_model(self, device_to=None):
-        keys = list(self.backup.keys())
+        if self.incremental_patching:
+            #keep the patched weights, the next patch_model() only recomputes keys whose patches changed
+            keys = []
+        else:
+            keys = list(self.backup.keys())
 
         if self.weight_inplace_update:
             for k in keys:
@@ -428,7 +428,7 @@ def load_checkpoint(config_path=None, ckpt_path=None, output_vae=True, output_cl
     return (ldm_patched.modules.model_patcher.ModelPatcher(model, load_device=model_management.get_torch_device(), offload_device=offload_device), clip, vae)
 
 def load_checkpoint_guess_config(ckpt_path, output_vae=True, output_clip=True, output_clipvision=False, embedding_directory=None, output_model=True, vae_filename_param=None):
-    sd = ldm_patched.modules.utils.load_torch_file(ckpt_path)
+    sd = ldm_patched.modules.utils.load_torch_file(ckpt_path, lazy=True)
     sd_keys = sd.keys()
     clip = None
     clipvision = None
@@ -480,7 +480,7 @@ def load_checkpoint_guess_config(ckpt_path, output_vae=True, output_clip=True, o
             sd = model_config.process_clip_state_dict(sd)
             load_model_weights(w, sd)
 
-    left_over = sd.keys()
+    left_over = list(sd.keys())
     if len(left_over) > 0:
         print("left over keys:", left_over)
 
@@ -1,15 +1,78 @@
+import collections.abc
+import functools
 import torch
 import math
 import struct
 import ldm_patched.modules.checkpoint_pickle
+import safetensors
 import safetensors.torch
 import numpy as np
 from PIL import Image
 
-def load_torch_file(ckpt, safe_load=False, device=None):
+class LazySafetensorsDict(collections.abc.MutableMapping):
+    #mmap backed state dict: a tensor is only read from disk when it is accessed and is
+    #dropped from the view once popped, so the UNet/CLIP/VAE parts can be split off one by one
+    def __init__(self, ckpt, device="cpu"):
+        self.ckpt = ckpt
+        self.handle = safetensors.safe_open(ckpt, framework="pt", device=device)
+        self.lazy_keys = dict.fromkeys(self.handle.keys())
+        self.loaded = {}
+
+    def __getitem__(self, key):
+        if key in self.loaded:
+            return self.loaded[key]
+        if key not in self.lazy_keys:
+            raise KeyError(key)
+        t = self.handle.get_tensor(key)
+        del self.lazy_keys[key]
+        self.loaded[key] = t
+        return t
+
+    def __setitem__(self, key, value):
+        self.lazy_keys.pop(key, None)
+        self.loaded[key] = value
+
+    def __delitem__(self, key):
+        if key in self.loaded:
+            del self.loaded[key]
+        elif key in self.lazy_keys:
+            del self.lazy_keys[key]
+        else:
+            raise KeyError(key)
+
+    def pop(self, key, *default):
+        if key in self.loaded:
+            return self.loaded.pop(key)
+        if key in self.lazy_keys:
+            del self.lazy_keys[key]
+            return self.handle.get_tensor(key)
+        if len(default) > 0:
+            return default[0]
+        raise KeyError(key)
+
+    def __contains__(self, key):
+        return key in self.loaded or key in self.lazy_keys
+
+    def __iter__(self):
+        yield from list(self.lazy_keys.keys()) + list(self.loaded.keys())
+
+    def __len__(self):
+        return len(self.lazy_keys) + len(self.loaded)
+
+    def numel(self, key):
+        if key in self.loaded:
+            return self.loaded[key].nelement()
+        return math.prod(self.handle.get_slice(key).get_shape())
+
+    def metadata(self):
+        return self.handle.metadata()
+
+def load_torch_file(ckpt, safe_load=False, device=None, lazy=False):
     if device is None:
         device = torch.device("cpu")
     if ckpt.lower().endswith(".safetensors"):
+        if lazy:
+            return LazySafetensorsDict(ckpt, device=device.type)
         sd = safetensors.torch.load_file(ckpt, device=device.type)
     else:
         if safe_load:
@@ -38,7 +101,10 @@ def calculate_parameters(sd, prefix=""):
     params = 0
     for k in sd.keys():
         if k.startswith(prefix):
-            params += sd[k].nelement()
+            if isinstance(sd, LazySafetensorsDict):
+                params += sd.numel(k) #reading the header is enough, no need to load the tensor
+            else:
+                params += sd[k].nelement()
     return params
 
 def state_dict_key_replace(state_dict, keys_to_replace):
@@ -404,31 +470,51 @@ def common_upscale(samples, width, height, upscale_method, crop):
 def get_tiled_scale_steps(width, height, tile_x, tile_y, overlap):
     return math.ceil((height / (tile_y - overlap))) * math.ceil((width / (tile_x - overlap)))
 
+@functools.lru_cache(maxsize=64)
+def feather_mask(height, width, feather, device=None):
+    #weights that fade the outer `feather` rows/columns of a tile linearly to zero, cached per tile shape
+    def ramp(n):
+        i = torch.arange(n, dtype=torch.float64)
+        r = torch.ones(n, dtype=torch.float64)
+        if feather > 0:
+            r = r * torch.where(i < feather, (i + 1) / feather, 1.0)
+            r = r * torch.where(n - 1 - i < feather, (n - i) / feather, 1.0)
+        return r
+    mask = ramp(height)[:, None] * ramp(width)[None, :]
+    return mask.to(dtype=torch.float32, device=device)[None, None]
+
 @torch.inference_mode()
-def tiled_scale(samples, function, tile_x=64, tile_y=64, overlap = 8, upscale_amount = 4, out_channels = 3, output_device="cpu", pbar = None):
+def tiled_scale(samples, function, tile_x=64, tile_y=64, overlap = 8, upscale_amount = 4, out_channels = 3, output_device="cpu", pbar = None, tile_batch_size = 1):
+    #tiles of equal shape are run through function in batches of tile_batch_size and blended on the device function returns
     output = torch.empty((samples.shape[0], out_channels, round(samples.shape[2] * upscale_amount), round(samples.shape[3] * upscale_amount)), device=output_device)
+    feather = round(overlap * upscale_amount)
     for b in range(samples.shape[0]):
         s = samples[b:b+1]
-        out = torch.zeros((s.shape[0], out_channels, round(s.shape[2] * upscale_amount), round(s.shape[3] * upscale_amount)), device=output_device)
-        out_div = torch.zeros((s.shape[0], out_channels, round(s.shape[2] * upscale_amount), round(s.shape[3] * upscale_amount)), device=output_device)
+        tiles = {}
         for y in range(0, s.shape[2], tile_y - overlap):
             for x in range(0, s.shape[3], tile_x - overlap):
-                s_in = s[:,:,y:y+tile_y,x:x+tile_x]
-
-                ps = function(s_in).to(output_device)
-                mask = torch.ones_like(ps)
-                feather = round(overlap * upscale_amount)
-                for t in range(feather):
-                        mask[:,:,t:1+t,:] *= ((1.0/feather) * (t + 1))
-                        mask[:,:,mask.shape[2] -1 -t: mask.shape[2]-t,:] *= ((1.0/feather) * (t + 1))
-                        mask[:,:,:,t:1+t] *= ((1.0/feather) * (t + 1))
-                        mask[:,:,:,mask.shape[3]- 1 - t: mask.shape[3]- t] *= ((1.0/feather) * (t + 1))
-                out[:,:,round(y*upscale_amount):round((y+tile_y)*upscale_amount),round(x*upscale_amount):round((x+tile_x)*upscale_amount)] += ps * mask
-                out_div[:,:,round(y*upscale_amount):round((y+tile_y)*upscale_amount),round(x*upscale_amount):round((x+tile_x)*upscale_amount)] += mask
+                shape = (min(tile_y, s.shape[2] - y), min(tile_x, s.shape[3] - x))
+                tiles.setdefault(shape, []).append((y, x))
+
+        out = None
+        out_div = None
+        for positions in tiles.values():
+            for i in range(0, len(positions), max(tile_batch_size, 1)):
+                chunk = positions[i:i + max(tile_batch_size, 1)]
+                ps = function(torch.cat([s[:,:,y:y+tile_y,x:x+tile_x] for y, x in chunk])).float()
+                if out is None:
+                    out = torch.zeros((1, out_channels, output.shape[2], output.shape[3]), device=ps.device)
+                    out_div = torch.zeros((1, 1, output.shape[2], output.shape[3]), device=ps.device)
+                mask = feather_mask(ps.shape[2], ps.shape[3], feather, ps.device)
+                for (y, x), p in zip(chunk, ps):
+                    oy, ox = round(y * upscale_amount), round(x * upscale_amount)
+                    h, w = min(p.shape[1], out.shape[2] - oy), min(p.shape[2], out.shape[3] - ox)
+                    out[:,:,oy:oy+h,ox:ox+w] += p[None,:,:h,:w] * mask[:,:,:h,:w]
+                    out_div[:,:,oy:oy+h,ox:ox+w] += mask[:,:,:h,:w]
                 if pbar is not None:
-                    pbar.update(1)
+                    pbar.update(len(chunk))
 
-        output[b:b+1] = out/out_div
+        output[b:b+1] = (out / out_div).to(output_device)
     return output
 
 PROGRESS_BAR_ENABLED = True
@@ -1,5 +1,6 @@
 import threading
 import numpy as np
+import args_manager
 import gradio.processing_utils as processing_utils
 import modules.config
 
@@ -8,6 +9,9 @@ from modules import config, flags
 from modules.util import HWC3, resample_image, erode_or_dilate
 from extras.inpaint_mask import generate_mask_from_image, SAMOptions
 from modules.patch import PatchSettings, patch_settings, patch_all
+from modules.preview_policy import PreviewPolicy
+from modules.task_queue import TaskQueue, TaskState, YieldChannel
+from modules.worker_pool import WorkerPool, is_pool_worker
 
 
 patch_all()
@@ -21,7 +25,11 @@ class AsyncTask:
         import args_manager
 
         self.args = args.copy()
-        self.yields = []
+        self.yields = YieldChannel()
+        self.preview_policy = PreviewPolicy(self.yields, args_manager.args.preview_max_fps,
+                                            args_manager.args.preview_max_size)
+        self.state = TaskState.QUEUED
+        self.wait_time = 0.0
         self.results = []
         self.last_stop = False
         self.processing = False
@@ -165,7 +173,7 @@ class AsyncTask:
         self.images_to_enhance_count = 0
         self.enhance_stats = {}
 
-async_tasks = []
+async_tasks = TaskQueue(args_manager.args.task_scheduler, args_manager.args.task_scheduler_window)
 
 
 class EarlyReturnException(BaseException):
@@ -196,14 +204,15 @@ def worker():
     import extras.ip_adapter as ip_adapter
     import extras.face_crop
     import fooocus_version
+    import modules.preprocess_cache as preprocess_cache
 
     from extras.censor import default_censor
     from modules.sdxl_styles import apply_style, get_random_style, fooocus_expansion, apply_arrays, random_style_name
-    from modules.private_logger import log
+    from modules.private_logger import log, image_writer, displayable
     from extras.expansion import safe_str
     from modules.util import (remove_empty_str, HWC3, resize_image, get_image_shape_ceil, set_image_shape_ceil,
                               get_shape_ceil, resample_image, erode_or_dilate, parse_lora_references_from_prompt,
-                              apply_wildcards)
+                              apply_wildcards_bulk)
     from modules.upscaler import perform_upscale
     from modules.flags import Performance
     from modules.meta_parser import get_metadata_parser
@@ -237,7 +246,8 @@ def worker():
         if do_not_show_finished_images:
             return
 
-        async_task.yields.append(['results', async_task.results])
+        # images still being written are shown from memory, their paths are used once the files exist
+        async_task.yields.append(['results', [displayable(result) for result in async_task.results]])
         return
 
     def build_image_wall(async_task):
@@ -315,7 +325,8 @@ def worker():
             tiled=tiled,
             cfg_scale=async_task.cfg_scale,
             refiner_swap_method=async_task.refiner_swap_method,
-            disable_preview=async_task.disable_preview
+            disable_preview=async_task.disable_preview,
+            preview_policy=async_task.preview_policy
         )
         del positive_cond, negative_cond  # Save memory
         if inpaint_worker.current_task is not None:
@@ -331,6 +342,61 @@ def worker():
 
         return imgs, img_paths, current_progress
 
+    def batch_task_ids(async_task, tasks, goals, initial_latent):
+        """Groups consecutive tasks that can be sampled as one UNet batch."""
+        batch_size = max(args_manager.args.diffusion_batch_size, 1)
+        if batch_size == 1 or initial_latent is not None or 'cn' in goals \
+                or inpaint_worker.current_task is not None \
+                or async_task.sampler_name not in pipeline.batch_safe_samplers:
+            return [[i] for i in range(len(tasks))]
+
+        batches = []
+        for i, task in enumerate(tasks):
+            key = (pipeline.cond_batch_key(task['c']), pipeline.cond_batch_key(task['uc']))
+            if len(batches) > 0 and len(batches[-1][1]) < batch_size and batches[-1][0] == key:
+                batches[-1][1].append(i)
+            else:
+                batches.append((key, [i]))
+        return [ids for _, ids in batches]
+
+    def process_task_batch(all_steps, async_task, callback, current_task_id, denoising_strength,
+                           final_scheduler_name, steps, switch, batch, loras, tiled, use_expansion, width, height,
+                           base_progress, preparation_steps, total_count, show_intermediate_results,
+                           persist_image=True):
+        if async_task.last_stop is not False:
+            ldm_patched.modules.model_management.interrupt_current_processing()
+        imgs = pipeline.process_diffusion(
+            positive_cond=pipeline.stack_conds([task['c'] for task in batch]),
+            negative_cond=pipeline.stack_conds([task['uc'] for task in batch]),
+            steps=steps,
+            switch=switch,
+            width=width,
+            height=height,
+            image_seed=[task['task_seed'] for task in batch],
+            callback=callback,
+            sampler_name=async_task.sampler_name,
+            scheduler_name=final_scheduler_name,
+            latent=None,
+            denoise=denoising_strength,
+            tiled=tiled,
+            cfg_scale=async_task.cfg_scale,
+            refiner_swap_method=async_task.refiner_swap_method,
+            disable_preview=async_task.disable_preview,
+            preview_policy=async_task.preview_policy
+        )
+        current_progress = int(base_progress + (100 - preparation_steps) / float(all_steps) * steps * len(batch))
+        if modules.config.default_black_out_nsfw or async_task.black_out_nsfw:
+            progressbar(async_task, current_progress, 'Checking for NSFW content ...')
+            imgs = default_censor(imgs)
+        img_paths = []
+        for i, (task, img) in enumerate(zip(batch, imgs)):
+            progressbar(async_task, current_progress, f'Saving image {current_task_id + i + 1}/{total_count} to system ...')
+            img_paths += save_and_log(async_task, height, [img], task, use_expansion, width, loras, persist_image)
+        yield_result(async_task, img_paths, current_progress, async_task.black_out_nsfw, False,
+                     do_not_show_finished_images=not show_intermediate_results or async_task.disable_intermediate_results)
+
+        return imgs, img_paths, current_progress
+
     def apply_patch_settings(async_task):
         patch_settings[pid] = PatchSettings(
             async_task.sharpness,
@@ -400,14 +466,26 @@ def worker():
 
         return img_paths
 
-    def apply_control_nets(async_task, height, ip_adapter_face_path, ip_adapter_path, width, current_progress):
+    def preprocess_ip_adapter(cn_img, ip_adapter_path, clip_vision_path, ip_negative_path):
+        compute = lambda: ip_adapter.preprocess(cn_img, ip_adapter_path=ip_adapter_path)
+        params = tuple(preprocess_cache.file_identity(path) for path in [ip_adapter_path, clip_vision_path, ip_negative_path])
+        if None in params:
+            # a model file that cannot be identified is not cached
+            return compute()
+        return preprocess_cache.cached('IP-Adapter', cn_img, params, compute)
+
+    def apply_control_nets(async_task, height, ip_adapter_face_path, ip_adapter_path, width, current_progress,
+                           clip_vision_path, ip_negative_path):
         for task in async_task.cn_tasks[flags.cn_canny]:
             cn_img, cn_stop, cn_weight = task
-            cn_img = resize_image(HWC3(cn_img), width=width, height=height)
 
             if not async_task.skipping_cn_preprocessor:
-                cn_img = preprocessors.canny_pyramid(cn_img, async_task.canny_low_threshold,
-                                                     async_task.canny_high_threshold)
+                cn_img = preprocess_cache.cached(
+                    flags.cn_canny, cn_img, (width, height, async_task.canny_low_threshold, async_task.canny_high_threshold),
+                    lambda: preprocessors.canny_pyramid(resize_image(HWC3(cn_img), width=width, height=height),
+                                                        async_task.canny_low_threshold, async_task.canny_high_threshold))
+            else:
+                cn_img = resize_image(HWC3(cn_img), width=width, height=height)
 
             cn_img = HWC3(cn_img)
             task[0] = core.numpy_to_pytorch(cn_img)
@@ -415,10 +493,13 @@ def worker():
                 yield_result(async_task, cn_img, current_progress, async_task.black_out_nsfw, do_not_show_finished_images=True)
         for task in async_task.cn_tasks[flags.cn_cpds]:
             cn_img, cn_stop, cn_weight = task
-            cn_img = resize_image(HWC3(cn_img), width=width, height=height)
 
             if not async_task.skipping_cn_preprocessor:
-                cn_img = preprocessors.cpds(cn_img)
+                cn_img = preprocess_cache.cached(
+                    flags.cn_cpds, cn_img, (width, height),
+                    lambda: preprocessors.cpds(resize_image(HWC3(cn_img), width=width, height=height)))
+            else:
+                cn_img = resize_image(HWC3(cn_img), width=width, height=height)
 
             cn_img = HWC3(cn_img)
             task[0] = core.numpy_to_pytorch(cn_img)
@@ -431,20 +512,22 @@ def worker():
             # https://github.com/tencent-ailab/IP-Adapter/blob/d580c50a291566bbf9fc7ac0f760506607297e6d/README.md?plain=1#L75
             cn_img = resize_image(cn_img, width=224, height=224, resize_mode=0)
 
-            task[0] = ip_adapter.preprocess(cn_img, ip_adapter_path=ip_adapter_path)
+            task[0] = preprocess_ip_adapter(cn_img, ip_adapter_path, clip_vision_path, ip_negative_path)
             if async_task.debugging_cn_preprocessor:
                 yield_result(async_task, cn_img, current_progress, async_task.black_out_nsfw, do_not_show_finished_images=True)
         for task in async_task.cn_tasks[flags.cn_ip_face]:
             cn_img, cn_stop, cn_weight = task
-            cn_img = HWC3(cn_img)
 
             if not async_task.skipping_cn_preprocessor:
-                cn_img = extras.face_crop.crop_image(cn_img)
+                cn_img = preprocess_cache.cached(
+                    flags.cn_ip_face, cn_img, (),
+                    lambda: extras.face_crop.crop_image(HWC3(cn_img)))
+            cn_img = HWC3(cn_img)
 
             # https://github.com/tencent-ailab/IP-Adapter/blob/d580c50a291566bbf9fc7ac0f760506607297e6d/README.md?plain=1#L75
             cn_img = resize_image(cn_img, width=224, height=224, resize_mode=0)
 
-            task[0] = ip_adapter.preprocess(cn_img, ip_adapter_path=ip_adapter_face_path)
+            task[0] = preprocess_ip_adapter(cn_img, ip_adapter_face_path, clip_vision_path, ip_negative_path)
             if async_task.debugging_cn_preprocessor:
                 yield_result(async_task, cn_img, current_progress, async_task.black_out_nsfw, do_not_show_finished_images=True)
         all_ip_tasks = async_task.cn_tasks[flags.cn_ip] + async_task.cn_tasks[flags.cn_ip_face]
@@ -577,12 +660,15 @@ def worker():
             async_task.inpaint_respective_field = 1.0
         return inpaint_image, inpaint_mask
 
-    def apply_upscale(async_task, uov_input_image, uov_method, switch, current_progress, advance_progress=False):
+    def apply_upscale(async_task, uov_input_image, uov_method, switch, current_progress, advance_progress=False,
+                      upscaled_image=None):
         H, W, C = uov_input_image.shape
         if advance_progress:
             current_progress += 1
-        progressbar(async_task, current_progress, f'Upscaling image from {str((W, H))} ...')
-        uov_input_image = perform_upscale(uov_input_image)
+        if upscaled_image is None:
+            progressbar(async_task, current_progress, f'Upscaling image from {str((W, H))} ...')
+            upscaled_image = perform_upscale(uov_input_image)
+        uov_input_image = upscaled_image
         print(f'Image upscaled.')
         if '1.5x' in uov_method:
             f = 1.5
@@ -674,6 +760,8 @@ def worker():
             current_progress += 1
         progressbar(async_task, current_progress, 'Processing prompts ...')
         tasks = []
+        # the wildcard files are checked for changes once for all images of the task
+        wildcards_checked = set()
         for i in range(image_number):
             if disable_seed_increment:
                 task_seed = async_task.seed % (constants.MAX_SEED + 1)
@@ -681,15 +769,15 @@ def worker():
                 task_seed = (async_task.seed + i) % (constants.MAX_SEED + 1)  # randint is inclusive, % is not
 
             task_rng = random.Random(task_seed)  # may bind to inpaint noise in the future
-            task_prompt = apply_wildcards(prompt, task_rng, i, async_task.read_wildcards_in_order)
-            task_prompt = apply_arrays(task_prompt, i)
-            task_negative_prompt = apply_wildcards(negative_prompt, task_rng, i, async_task.read_wildcards_in_order)
-            task_extra_positive_prompts = [apply_wildcards(pmt, task_rng, i, async_task.read_wildcards_in_order) for pmt
-                                           in
-                                           extra_positive_prompts]
-            task_extra_negative_prompts = [apply_wildcards(pmt, task_rng, i, async_task.read_wildcards_in_order) for pmt
-                                           in
-                                           extra_negative_prompts]
+            # same rng order as expanding the prompts one by one
+            expanded_prompts = apply_wildcards_bulk([prompt, negative_prompt] + extra_positive_prompts
+                                                    + extra_negative_prompts,
+                                                    task_rng, i, async_task.read_wildcards_in_order,
+                                                    wildcards_checked)
+            task_prompt = apply_arrays(expanded_prompts[0], i)
+            task_negative_prompt = expanded_prompts[1]
+            task_extra_positive_prompts = expanded_prompts[2:2 + len(extra_positive_prompts)]
+            task_extra_negative_prompts = expanded_prompts[2 + len(extra_positive_prompts):]
 
             positive_basic_workloads = []
             negative_basic_workloads = []
@@ -748,17 +836,23 @@ def worker():
                 t['positive'] = copy.deepcopy(t['positive']) + [expansion]  # Deep copy.
         if advance_progress:
             current_progress += 1
-        for i, t in enumerate(tasks):
-            progressbar(async_task, current_progress, f'Encoding positive #{i + 1} ...')
-            t['c'] = pipeline.clip_encode(texts=t['positive'], pool_top_k=t['positive_top_k'])
+        # all positive and negative prompts of all tasks are deduplicated and encoded in a few batches
+        encode_negative = abs(float(async_task.cfg_scale) - 1.0) >= 1e-4
+        text_lists = [t['positive'] for t in tasks]
+        pool_top_ks = [t['positive_top_k'] for t in tasks]
+        if encode_negative:
+            text_lists += [t['negative'] for t in tasks]
+            pool_top_ks += [t['negative_top_k'] for t in tasks]
+        progressbar(async_task, current_progress, f'Encoding {len(text_lists)} prompts ...')
+        conds = pipeline.clip_encode_batch(text_lists, pool_top_ks)
         if advance_progress:
             current_progress += 1
         for i, t in enumerate(tasks):
-            if abs(float(async_task.cfg_scale) - 1.0) < 1e-4:
-                t['uc'] = pipeline.clone_cond(t['c'])
+            t['c'] = conds[i]
+            if encode_negative:
+                t['uc'] = conds[len(tasks) + i]
             else:
-                progressbar(async_task, current_progress, f'Encoding negative #{i + 1} ...')
-                t['uc'] = pipeline.clip_encode(texts=t['negative'], pool_top_k=t['negative_top_k'])
+                t['uc'] = pipeline.clone_cond(t['c'])
         return tasks, use_expansion, loras, current_progress
 
     def apply_freeu(async_task):
@@ -1091,7 +1185,8 @@ def worker():
                         inpaint_engine, inpaint_respective_field, inpaint_strength,
                         prompt, negative_prompt, final_scheduler_name, goals, height, img, mask,
                         preparation_steps, steps, switch, tiled, total_count, use_expansion, use_style,
-                        use_synthetic_refiner, width, show_intermediate_results=True, persist_image=True):
+                        use_synthetic_refiner, width, show_intermediate_results=True, persist_image=True,
+                        upscaled_image=None):
         base_model_additional_loras = []
         inpaint_head_model_path = None
         inpaint_parameterized = inpaint_engine != 'None'  # inpaint_engine = None, improve detail
@@ -1106,7 +1201,8 @@ def worker():
                 async_task, async_task.enhance_uov_method, denoising_strength, img, switch, current_progress)
         if 'upscale' in goals:
             direct_return, img, denoising_strength, initial_latent, tiled, width, height, current_progress = apply_upscale(
-                async_task, img, async_task.enhance_uov_method, switch, current_progress)
+                async_task, img, async_task.enhance_uov_method, switch, current_progress,
+                upscaled_image=upscaled_image)
             if direct_return:
                 d = [('Upscale (Fast)', 'upscale_fast', '2x')]
                 if modules.config.default_black_out_nsfw or async_task.black_out_nsfw:
@@ -1158,7 +1254,8 @@ def worker():
     def enhance_upscale(all_steps, async_task, base_progress, callback, controlnet_canny_path, controlnet_cpds_path,
                         current_task_id, denoising_strength, done_steps_inpainting, done_steps_upscaling, enhance_steps,
                         prompt, negative_prompt, final_scheduler_name, height, img, preparation_steps, switch, tiled,
-                        total_count, use_expansion, use_style, use_synthetic_refiner, width, persist_image=True):
+                        total_count, use_expansion, use_style, use_synthetic_refiner, width, persist_image=True,
+                        upscaled_image=None):
         # reset inpaint worker to prevent tensor size issues and not mix upscale and inpainting
         inpaint_worker.current_task = None
 
@@ -1176,7 +1273,8 @@ def worker():
                     controlnet_cpds_path, current_progress, current_task_id, denoising_strength, False,
                     'None', 0.0, 0.0, prompt, negative_prompt, final_scheduler_name,
                     goals_enhance, height, img, None, preparation_steps, steps, switch, tiled, total_count,
-                    use_expansion, use_style, use_synthetic_refiner, width, persist_image=persist_image)
+                    use_expansion, use_style, use_synthetic_refiner, width, persist_image=persist_image,
+                    upscaled_image=upscaled_image)
 
             except ldm_patched.modules.model_management.InterruptProcessingException:
                 if async_task.last_stop == 'skip':
@@ -1339,7 +1437,8 @@ def worker():
                 return
 
         if 'cn' in goals:
-            apply_control_nets(async_task, height, ip_adapter_face_path, ip_adapter_path, width, current_progress)
+            apply_control_nets(async_task, height, ip_adapter_face_path, ip_adapter_path, width, current_progress,
+                               clip_vision_path, ip_negative_path)
             if async_task.debugging_cn_preprocessor:
                 return
 
@@ -1400,32 +1499,51 @@ def worker():
         preparation_steps = current_progress
         total_count = async_task.image_number
 
+        current_batch_size = 1
+
         def callback(step, x0, x, total_steps, y):
             if step == 0:
                 async_task.callback_steps = 0
-            async_task.callback_steps += (100 - preparation_steps) / float(all_steps)
+            async_task.callback_steps += (100 - preparation_steps) / float(all_steps) * current_batch_size
+            if current_batch_size > 1:
+                image_label = f'images {current_task_id + 1}-{current_task_id + current_batch_size}/{total_count}'
+            else:
+                image_label = f'image {current_task_id + 1}/{total_count}'
             async_task.yields.append(['preview', (
                 int(current_progress + async_task.callback_steps),
-                f'Sampling step {step + 1}/{total_steps}, image {current_task_id + 1}/{total_count} ...', y)])
+                f'Sampling step {step + 1}/{total_steps}, {image_label} ...', y)])
 
         show_intermediate_results = len(tasks) > 1 or async_task.should_enhance
         persist_image = not async_task.should_enhance or not async_task.save_final_enhanced_image_only
 
-        for current_task_id, task in enumerate(tasks):
+        for task_ids in batch_task_ids(async_task, tasks, goals, initial_latent):
+            current_task_id = task_ids[0]
+            current_batch_size = len(task_ids)
+            batch = [tasks[i] for i in task_ids]
             progressbar(async_task, current_progress, f'Preparing task {current_task_id + 1}/{async_task.image_number} ...')
             execution_start_time = time.perf_counter()
 
             try:
-                imgs, img_paths, current_progress = process_task(all_steps, async_task, callback, controlnet_canny_path,
-                                                                 controlnet_cpds_path, current_task_id,
-                                                                 denoising_strength, final_scheduler_name, goals,
-                                                                 initial_latent, async_task.steps, switch, task['c'],
-                                                                 task['uc'], task, loras, tiled, use_expansion, width,
-                                                                 height, current_progress, preparation_steps,
-                                                                 async_task.image_number, show_intermediate_results,
-                                                                 persist_image)
-
-                current_progress = int(preparation_steps + (100 - preparation_steps) / float(all_steps) * async_task.steps * (current_task_id + 1))
+                if len(batch) > 1:
+                    imgs, img_paths, current_progress = process_task_batch(all_steps, async_task, callback,
+                                                                           current_task_id, denoising_strength,
+                                                                           final_scheduler_name, async_task.steps,
+                                                                           switch, batch, loras, tiled, use_expansion,
+                                                                           width, height, current_progress,
+                                                                           preparation_steps, async_task.image_number,
+                                                                           show_intermediate_results, persist_image)
+                else:
+                    task = batch[0]
+                    imgs, img_paths, current_progress = process_task(all_steps, async_task, callback, controlnet_canny_path,
+                                                                     controlnet_cpds_path, current_task_id,
+                                                                     denoising_strength, final_scheduler_name, goals,
+                                                                     initial_latent, async_task.steps, switch, task['c'],
+                                                                     task['uc'], task, loras, tiled, use_expansion, width,
+                                                                     height, current_progress, preparation_steps,
+                                                                     async_task.image_number, show_intermediate_results,
+                                                                     persist_image)
+
+                current_progress = int(preparation_steps + (100 - preparation_steps) / float(all_steps) * async_task.steps * (task_ids[-1] + 1))
                 images_to_enhance += imgs
 
             except ldm_patched.modules.model_management.InterruptProcessingException:
@@ -1437,10 +1555,13 @@ def worker():
                     print('User stopped')
                     break
 
-            del task['c'], task['uc']  # Save memory
+            for task in batch:
+                del task['c'], task['uc']  # Save memory
             execution_time = time.perf_counter() - execution_start_time
             print(f'Generating and saving time: {execution_time:.2f} seconds')
 
+        current_batch_size = 1
+
         if not async_task.should_enhance:
             print(f'[Enhance] Skipping, preconditions aren\'t met')
             stop_processing(async_task, processing_start_time)
@@ -1465,6 +1586,14 @@ def worker():
         done_steps_inpainting = 0
         enhance_steps, _, _, _ = apply_overrides(async_task, async_task.original_steps, height, width)
         exception_result = None
+
+        # the images are known before any enhancement runs, upscale them together
+        upscaled_images = [None] * len(images_to_enhance)
+        if (enhance_uov_before and len(images_to_enhance) > 1 and 'vary' not in async_task.enhance_uov_method
+                and 'upscale' in async_task.enhance_uov_method):
+            progressbar(async_task, current_progress, f'Upscaling {len(images_to_enhance)} images ...')
+            upscaled_images = perform_upscale([HWC3(img) for img in images_to_enhance])
+
         for index, img in enumerate(images_to_enhance):
             async_task.enhance_stats[index] = 0
             enhancement_image_start_time = time.perf_counter()
@@ -1479,7 +1608,8 @@ def worker():
                     all_steps, async_task, base_progress, callback, controlnet_canny_path, controlnet_cpds_path,
                     current_task_id, denoising_strength, done_steps_inpainting, done_steps_upscaling, enhance_steps,
                     async_task.prompt, async_task.negative_prompt, final_scheduler_name, height, img, preparation_steps,
-                    switch, tiled, total_count, use_expansion, use_style, use_synthetic_refiner, width, persist_image)
+                    switch, tiled, total_count, use_expansion, use_style, use_synthetic_refiner, width, persist_image,
+                    upscaled_images[index])
                 async_task.enhance_stats[index] += 1
 
                 if exception_result == 'continue':
@@ -1596,23 +1726,38 @@ def worker():
         return
 
     while True:
-        time.sleep(0.01)
-        if len(async_tasks) > 0:
-            task = async_tasks.pop(0)
-
-            try:
-                handler(task)
-                if task.generate_image_grid:
-                    build_image_wall(task)
-                task.yields.append(['finish', task.results])
-                pipeline.prepare_text_encoder(async_call=True)
-            except:
-                traceback.print_exc()
-                task.yields.append(['finish', task.results])
-            finally:
-                if pid in modules.patch.patch_settings:
-                    del modules.patch.patch_settings[pid]
+        task = async_tasks.get()
+        metrics = async_tasks.metrics()
+        print(f'[Queue] Task waited {task.wait_time:.2f} seconds, {metrics["depth"]} task(s) still queued '
+              f'(average wait {metrics["average_wait_time"]:.2f} seconds).')
+        if async_tasks.policy != 'fifo':
+            print(f'[Queue] {metrics["model_reloads"]} model reload(s) so far, '
+                  f'{metrics["reloads_saved"]} saved by {async_tasks.policy} scheduling.')
+
+        try:
+            handler(task)
+            image_writer.flush(task.results)
+            if task.generate_image_grid:
+                build_image_wall(task)
+            task.state = TaskState.DONE
+            task.yields.append(['finish', task.results])
+            pipeline.prepare_text_encoder(async_call=True)
+        except:
+            traceback.print_exc()
+            image_writer.flush(task.results)
+            task.state = TaskState.DONE
+            task.yields.append(['finish', task.results])
+        finally:
+            if pid in modules.patch.patch_settings:
+                del modules.patch.patch_settings[pid]
     pass
 
 
-threading.Thread(target=worker, daemon=True).start()
+worker_pool = None
+
+if args_manager.args.worker_pool_size > 1 and not is_pool_worker():
+    worker_pool = WorkerPool(async_tasks, args_manager.args.worker_pool_size,
+                             devices=args_manager.args.worker_pool_devices)
+    worker_pool.start()
+else:
+    threading.Thread(target=worker, daemon=True).start()
@@ -2,6 +2,7 @@ import os
 import json
 import math
 import numbers
+import threading
 
 import args_manager
 import tempfile
@@ -9,7 +10,7 @@ import modules.flags
 import modules.sdxl_styles
 
 from modules.model_loader import load_file_from_url
-from modules.extra_utils import makedirs_with_log, get_files_from_folder, try_eval_env_var
+from modules.extra_utils import makedirs_with_log, get_files_from_folder, try_eval_env_var, FolderWatcher
 from modules.flags import OutputFormat, Performance, MetadataScheme
 
 
@@ -810,16 +811,61 @@ def get_model_filenames(folder_paths, extensions=None, name_filter=None):
     return files
 
 
+update_files_lock = threading.Lock()
+file_watcher = None
+# the background update_files() of refresh_files()
+files_rescan = None
+files_rescan_lock = threading.Lock()
+
+
 def update_files():
     global model_filenames, lora_filenames, vae_filenames, wildcard_filenames, available_presets
-    model_filenames = get_model_filenames(paths_checkpoints)
-    lora_filenames = get_model_filenames(paths_loras)
-    vae_filenames = get_model_filenames(path_vae)
-    wildcard_filenames = get_files_from_folder(path_wildcards, ['.txt'])
-    available_presets = get_presets()
+    # directories whose mtime did not change are served from the listing cache in extra_utils
+    with update_files_lock:
+        model_filenames = get_model_filenames(paths_checkpoints)
+        lora_filenames = get_model_filenames(paths_loras)
+        vae_filenames = get_model_filenames(path_vae)
+        wildcard_filenames = get_files_from_folder(path_wildcards, ['.txt'])
+        available_presets = get_presets()
     return
 
 
+def rescan_files():
+    try:
+        update_files()
+    except Exception as e:
+        print(f'[Files] Refresh failed: {e}')
+
+
+def refresh_files(timeout=1.0):
+    """Rescans the model folders in the background and waits up to timeout seconds for the new lists.
+
+    A slower scan, e.g. of a network drive, keeps running and the current lists stay in place until it is done.
+    """
+    global files_rescan
+
+    # the watcher keeps the lists current from its own thread, a manual refresh has nothing to do
+    if file_watcher is not None and file_watcher.alive:
+        return
+
+    with files_rescan_lock:
+        # clicks during a running rescan wait for that one instead of starting another
+        if files_rescan is None or not files_rescan.is_alive():
+            files_rescan = threading.Thread(target=rescan_files, daemon=True)
+            files_rescan.start()
+        rescan = files_rescan
+    rescan.join(timeout)
+    if rescan.is_alive():
+        print(f'[Files] Folder scan takes longer than {timeout} seconds, showing the previous file lists.')
+
+
+def start_file_watcher():
+    global file_watcher
+    file_watcher = FolderWatcher(paths_checkpoints + paths_loras + [path_vae, path_wildcards], update_files)
+    if not file_watcher.start():
+        file_watcher = None
+
+
 def downloading_inpaint_models(v):
     assert v in modules.flags.inpaint_engine_versions
 
@@ -1,7 +1,9 @@
 import os
+import time
 import einops
 import torch
 import numpy as np
+import args_manager
 
 import ldm_patched.modules.model_management
 import ldm_patched.modules.model_detection
@@ -21,6 +23,7 @@ from modules.lora import match_lora
 from modules.util import get_file_from_folder_list
 from ldm_patched.modules.lora import model_lora_keys_unet, model_lora_keys_clip
 from modules.config import path_embeddings
+from modules.model_cache import LRUCache
 from ldm_patched.contrib.external_model_advanced import ModelSamplingDiscrete, ModelSamplingContinuousEDM
 
 opEmptyLatentImage = EmptyLatentImage()
@@ -34,6 +37,22 @@ opModelSamplingDiscrete = ModelSamplingDiscrete()
 opModelSamplingContinuousEDM = ModelSamplingContinuousEDM()
 
 
+def tensors_size(obj):
+    if isinstance(obj, torch.Tensor):
+        return obj.nelement() * obj.element_size()
+    if isinstance(obj, dict):
+        return sum(tensors_size(v) for v in obj.values())
+    if isinstance(obj, (list, tuple)):
+        return sum(tensors_size(v) for v in obj)
+    return 0
+
+
+# matched LoRA patch dicts, keyed by (lora file, mtime, target model); values are
+# (lora_unet, lora_clip, unmatched keys, seconds it took to load and match the file)
+lora_patch_cache = LRUCache(int(args_manager.args.lora_cache_size * 1024 ** 3),
+                            lambda entry: tensors_size(entry[:2]), name='LoRA Cache')
+
+
 class StableDiffusionModel:
     def __init__(self, unet=None, vae=None, clip=None, clip_vision=None, filename=None, vae_filename=None):
         self.unet = unet
@@ -92,10 +111,12 @@ class StableDiffusionModel:
         self.unet_with_lora = self.unet.clone() if self.unet is not None else None
         self.clip_with_lora = self.clip.clone() if self.clip is not None else None
 
+        time_saved = 0.0
+
         for lora_filename, weight in loras_to_load:
-            lora_unmatch = ldm_patched.modules.utils.load_torch_file(lora_filename, safe_load=False)
-            lora_unet, lora_unmatch = match_lora(lora_unmatch, self.lora_key_map_unet)
-            lora_clip, lora_unmatch = match_lora(lora_unmatch, self.lora_key_map_clip)
+            lora_unet, lora_clip, lora_unmatch, load_time, cached = self.match_lora_file(lora_filename)
+            if cached:
+                time_saved += load_time
 
             if len(lora_unmatch) > 12:
                 # model mismatch
@@ -103,7 +124,7 @@ class StableDiffusionModel:
 
             if len(lora_unmatch) > 0:
                 print(f'Loaded LoRA [{lora_filename}] for model [{self.filename}] '
-                      f'with unmatched keys {list(lora_unmatch.keys())}')
+                      f'with unmatched keys {lora_unmatch}')
 
             if self.unet_with_lora is not None and len(lora_unet) > 0:
                 loaded_keys = self.unet_with_lora.add_patches(lora_unet, weight)
@@ -121,6 +142,26 @@ class StableDiffusionModel:
                     if item not in loaded_keys:
                         print("CLIP LoRA key skipped: ", item)
 
+        if time_saved > 0:
+            print(f'[LoRA Cache] Reused parsed LoRAs for model [{self.filename}], saved {time_saved:.2f} seconds.')
+
+    def match_lora_file(self, lora_filename):
+        key = (lora_filename, os.stat(lora_filename).st_mtime_ns,
+               self.filename, self.unet is not None, self.clip is not None)
+        entry = lora_patch_cache.get(key)
+        if entry is not None:
+            return entry + (True,)
+
+        start = time.perf_counter()
+        lora_unmatch = ldm_patched.modules.utils.load_torch_file(lora_filename, safe_load=False)
+        lora_unet, lora_unmatch = match_lora(lora_unmatch, self.lora_key_map_unet)
+        lora_clip, lora_unmatch = match_lora(lora_unmatch, self.lora_key_map_clip)
+        entry = (lora_unet, lora_clip, list(lora_unmatch.keys()), time.perf_counter() - start)
+
+        # mismatching files are cached too, so they are not parsed again just to be skipped
+        lora_patch_cache.put(key, entry)
+        return entry + (False,)
+
 
 @torch.no_grad()
 @torch.inference_mode()
@@ -251,21 +292,32 @@ def get_previewer(model):
     @torch.inference_mode()
     def preview_function(x0, step, total_steps):
         with torch.no_grad():
-            x_sample = x0.to(VAE_approx_model.current_type)
+            x_sample = x0[:1].to(VAE_approx_model.current_type)
             x_sample = VAE_approx_model(x_sample) * 127.5 + 127.5
             x_sample = einops.rearrange(x_sample, 'b c h w -> b h w c')[0]
-            x_sample = x_sample.cpu().numpy().clip(0, 255).astype(np.uint8)
+            # convert on the device so only uint8 pixels are copied to the CPU
+            x_sample = x_sample.clamp(0, 255).to(torch.uint8).cpu().numpy()
             return x_sample
 
     return preview_function
 
 
+def prepare_noise(latent_image, seed, batch_inds=None):
+    """With a list of seeds every sample gets the noise it would get when sampled alone with its seed."""
+    if not isinstance(seed, list):
+        return ldm_patched.modules.sample.prepare_noise(latent_image, seed, batch_inds)
+    assert len(seed) == latent_image.shape[0], 'One seed is required per sample in the batch.'
+    return torch.cat([ldm_patched.modules.sample.prepare_noise(latent_image[i:i + 1], s)
+                      for i, s in enumerate(seed)], dim=0)
+
+
 @torch.no_grad()
 @torch.inference_mode()
 def ksampler(model, positive, negative, latent, seed=None, steps=30, cfg=7.0, sampler_name='dpmpp_2m_sde_gpu',
              scheduler='karras', denoise=1.0, disable_noise=False, start_step=None, last_step=None,
              force_full_denoise=False, callback_function=None, refiner=None, refiner_switch=-1,
-             previewer_start=None, previewer_end=None, sigmas=None, noise_mean=None, disable_preview=False):
+             previewer_start=None, previewer_end=None, sigmas=None, noise_mean=None, disable_preview=False,
+             preview_policy=None):
 
     if sigmas is not None:
         sigmas = sigmas.clone().to(ldm_patched.modules.model_management.get_torch_device())
@@ -276,7 +328,7 @@ def ksampler(model, positive, negative, latent, seed=None, steps=30, cfg=7.0, sa
         noise = torch.zeros(latent_image.size(), dtype=latent_image.dtype, layout=latent_image.layout, device="cpu")
     else:
         batch_inds = latent["batch_index"] if "batch_index" in latent else None
-        noise = ldm_patched.modules.sample.prepare_noise(latent_image, seed, batch_inds)
+        noise = prepare_noise(latent_image, seed, batch_inds)
 
     if isinstance(noise_mean, torch.Tensor):
         noise = noise + noise_mean - torch.mean(noise, dim=1, keepdim=True)
@@ -297,7 +349,10 @@ def ksampler(model, positive, negative, latent, seed=None, steps=30, cfg=7.0, sa
         ldm_patched.modules.model_management.throw_exception_if_processing_interrupted()
         y = None
         if previewer is not None and not disable_preview:
-            y = previewer(x0, previewer_start + step, previewer_end)
+            if preview_policy is None:
+                y = previewer(x0, previewer_start + step, previewer_end)
+            elif preview_policy.should_decode(step, total_steps):
+                y = previewer(preview_policy.prepare(x0), previewer_start + step, previewer_end)
         if callback_function is not None:
             callback_function(previewer_start + step, x0, x, previewer_end, y)
 
@@ -315,7 +370,8 @@ def ksampler(model, positive, negative, latent, seed=None, steps=30, cfg=7.0, sa
                                                     last_step=last_step,
                                                     force_full_denoise=force_full_denoise, noise_mask=noise_mask,
                                                     callback=callback,
-                                                    disable_pbar=disable_pbar, seed=seed, sigmas=sigmas)
+                                                    disable_pbar=disable_pbar, seed=seed[0] if isinstance(seed, list) else seed,
+                                                    sigmas=sigmas)
 
         out = latent.copy()
         out["samples"] = samples
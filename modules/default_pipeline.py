@@ -1,5 +1,6 @@
 import modules.core as core
 import os
+import hashlib
 import torch
 import modules.patch
 import modules.config
@@ -8,7 +9,9 @@ import ldm_patched.modules.model_management
 import ldm_patched.modules.latent_formats
 import modules.inpaint_worker
 import extras.vae_interpose as vae_interpose
+import args_manager
 from extras.expansion import FooocusExpansion
+from modules.model_cache import LRUCache
 
 from ldm_patched.modules.model_base import SDXL, SDXLRefiner
 from modules.sample_hijack import clip_separate
@@ -28,6 +31,50 @@ final_refiner_vae = None
 loaded_ControlNets = {}
 
 
+def checkpoint_size(model):
+    size = 0
+    for m in [model.unet.model if model.unet is not None else None,
+              model.clip.cond_stage_model if model.clip is not None else None,
+              model.vae.first_stage_model if model.vae is not None else None]:
+        if m is not None:
+            size += ldm_patched.modules.model_management.module_size(m)
+    return size
+
+
+def pin_checkpoint_memory(model):
+    if not torch.cuda.is_available():
+        return
+    for m in [model.unet.model if model.unet is not None else None,
+              model.clip.cond_stage_model if model.clip is not None else None,
+              model.vae.first_stage_model if model.vae is not None else None]:
+        if m is None:
+            continue
+        for t in list(m.parameters()) + list(m.buffers()):
+            if t.device.type == 'cpu' and not t.is_pinned():
+                t.data = t.data.pin_memory()
+
+
+def release_checkpoint(key, model):
+    print(f'[Checkpoint Cache] Evicted {key[1]}')
+    ldm_patched.modules.model_management.cleanup_models()
+    ldm_patched.modules.model_management.soft_empty_cache()
+
+
+checkpoint_cache = LRUCache(int(args_manager.args.checkpoint_cache_size * 1024 ** 3), checkpoint_size,
+                            on_evict=release_checkpoint, name='Checkpoint Cache')
+
+
+def load_checkpoint_cached(key, load_fn):
+    model = checkpoint_cache.get(key)
+    if model is not None:
+        print(f'[Checkpoint Cache] Reusing {key[1]}')
+        return model
+    model = load_fn()
+    if checkpoint_cache.put(key, model) and args_manager.args.checkpoint_cache_pin_memory:
+        pin_checkpoint_memory(model)
+    return model
+
+
 @torch.no_grad()
 @torch.inference_mode()
 def refresh_controlnets(model_paths):
@@ -71,7 +118,8 @@ def refresh_base_model(name, vae_name=None):
     if model_base.filename == filename and model_base.vae_filename == vae_filename:
         return
 
-    model_base = core.load_model(filename, vae_filename)
+    model_base = load_checkpoint_cached(('base', filename, vae_filename),
+                                        lambda: core.load_model(filename, vae_filename))
     print(f'Base model loaded: {model_base.filename}')
     print(f'VAE loaded: {model_base.vae_filename}')
     return
@@ -93,19 +141,24 @@ def refresh_refiner_model(name):
         print(f'Refiner unloaded.')
         return
 
-    model_refiner = core.load_model(filename)
+    model_refiner = load_checkpoint_cached(('refiner', filename), lambda: load_refiner_model(filename))
     print(f'Refiner model loaded: {model_refiner.filename}')
+    return
+
 
-    if isinstance(model_refiner.unet.model, SDXL):
-        model_refiner.clip = None
-        model_refiner.vae = None
-    elif isinstance(model_refiner.unet.model, SDXLRefiner):
-        model_refiner.clip = None
-        model_refiner.vae = None
+def load_refiner_model(filename):
+    refiner = core.load_model(filename)
+
+    if isinstance(refiner.unet.model, SDXL):
+        refiner.clip = None
+        refiner.vae = None
+    elif isinstance(refiner.unet.model, SDXLRefiner):
+        refiner.clip = None
+        refiner.vae = None
     else:
-        model_refiner.clip = None
+        refiner.clip = None
 
-    return
+    return refiner
 
 
 @torch.no_grad()
@@ -142,22 +195,128 @@ def refresh_loras(loras, base_model_additional_loras=None):
     return
 
 
+# conditions keyed by (CLIP weights identity, clip skip, text); survives refresh_everything()
+clip_cond_cache = LRUCache(int(args_manager.args.clip_cache_size * 1024 ** 2), core.tensors_size, name='CLIP Cache')
+
+
+def clip_identity(base_model, loras):
+    if base_model.filename is None:
+        return None
+    return base_model.filename, os.stat(base_model.filename).st_mtime_ns, str(loras)
+
+
+def clip_disk_cache_path(key):
+    if args_manager.args.clip_cache_path is None:
+        return None
+    name = hashlib.sha256(repr(key).encode('utf-8')).hexdigest()
+    return os.path.join(args_manager.args.clip_cache_path, name[:2], f'{name}.pt')
+
+
+def load_cond_from_disk(key):
+    path = clip_disk_cache_path(key)
+    if path is None or not os.path.exists(path):
+        return None
+    try:
+        device = ldm_patched.modules.model_management.intermediate_device()
+        cond, pooled = torch.load(path, map_location=device, weights_only=True)
+        return cond, pooled
+    except Exception as e:
+        print(f'[CLIP Cache] Failed to read {path}: {e}')
+        return None
+
+
+def save_cond_to_disk(key, result):
+    path = clip_disk_cache_path(key)
+    if path is None:
+        return
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        temp_path = f'{path}.{os.getpid()}.tmp'
+        torch.save(tuple(x.cpu() for x in result), temp_path)
+        os.replace(temp_path, path)
+    except Exception as e:
+        print(f'[CLIP Cache] Failed to write {path}: {e}')
+
+
+def get_cached_cond(clip, text):
+    identity = getattr(clip, 'fcs_identity', None)
+    if identity is None:
+        return clip.fcs_cond_cache.get(text, None)
+    key = (identity, clip.layer_idx, text)
+    cached = clip_cond_cache.get(key)
+    if cached is None:
+        cached = load_cond_from_disk(key)
+        if cached is not None:
+            clip_cond_cache.put(key, cached)
+    return cached
+
+
+def store_cond(clip, text, result):
+    identity = getattr(clip, 'fcs_identity', None)
+    if identity is None:
+        clip.fcs_cond_cache[text] = result
+        return
+    key = (identity, clip.layer_idx, text)
+    clip_cond_cache.put(key, result)
+    save_cond_to_disk(key, result)
+
+
 @torch.no_grad()
 @torch.inference_mode()
 def clip_encode_single(clip, text, verbose=False):
-    cached = clip.fcs_cond_cache.get(text, None)
+    cached = get_cached_cond(clip, text)
     if cached is not None:
         if verbose:
             print(f'[CLIP Cached] {text}')
         return cached
     tokens = clip.tokenize(text)
     result = clip.encode_from_tokens(tokens, return_pooled=True)
-    clip.fcs_cond_cache[text] = result
+    store_cond(clip, text, result)
     if verbose:
         print(f'[CLIP Encoded] {text}')
     return result
 
 
+# maximum number of prompts sent through the text encoder in one forward pass
+clip_encode_batch_size = 16
+
+
+@torch.no_grad()
+@torch.inference_mode()
+def clip_encode_texts(clip, texts, verbose=False):
+    results = {}
+    to_encode = []
+    seen = set()
+    for text in texts:
+        if text in seen:
+            continue
+        seen.add(text)
+        cached = get_cached_cond(clip, text)
+        if cached is not None:
+            results[text] = cached
+        else:
+            to_encode.append(text)
+
+    if len(to_encode) > 0:
+        if clip.layer_idx is not None:
+            clip.cond_stage_model.clip_layer(clip.layer_idx)
+        else:
+            clip.cond_stage_model.reset_clip_layer()
+        clip.load_model()
+
+        for i in range(0, len(to_encode), clip_encode_batch_size):
+            batch = to_encode[i:i + clip_encode_batch_size]
+            encoded = clip.cond_stage_model.encode_token_weights_batch([clip.tokenize(text) for text in batch])
+            for text, result in zip(batch, encoded):
+                store_cond(clip, text, result)
+                results[text] = result
+
+    if verbose:
+        print(f'[CLIP Batch] {len(seen)} unique texts, {len(to_encode)} encoded in '
+              f'{(len(to_encode) + clip_encode_batch_size - 1) // clip_encode_batch_size} batches')
+    return results
+
+
 @torch.no_grad()
 @torch.inference_mode()
 def clone_cond(conds):
@@ -201,6 +360,37 @@ def clip_encode(texts, pool_top_k=1):
     return [[torch.cat(cond_list, dim=1), {"pooled_output": pooled_acc}]]
 
 
+@torch.no_grad()
+@torch.inference_mode()
+def clip_encode_batch(text_lists, pool_top_ks):
+    global final_clip
+
+    if final_clip is None:
+        return [None] * len(text_lists)
+
+    text_lists = [[texts] if isinstance(texts, str) else texts or [] for texts in text_lists]
+    encoded = clip_encode_texts(final_clip, [text for texts in text_lists for text in texts], verbose=True)
+
+    results = []
+    for texts, pool_top_k in zip(text_lists, pool_top_ks):
+        if len(texts) == 0:
+            results.append(None)
+            continue
+
+        cond_list = []
+        pooled_acc = 0
+
+        for i, text in enumerate(texts):
+            cond, pooled = encoded[text]
+            cond_list.append(cond)
+            if i < pool_top_k:
+                pooled_acc += pooled
+
+        results.append([[torch.cat(cond_list, dim=1), {"pooled_output": pooled_acc}]])
+
+    return results
+
+
 @torch.no_grad()
 @torch.inference_mode()
 def set_clip_skip(clip_skip: int):
@@ -256,6 +446,9 @@ def refresh_everything(refiner_model_name, base_model_name, loras,
     final_clip = model_base.clip_with_lora
     final_vae = model_base.vae
 
+    if final_clip is not None:
+        final_clip.fcs_identity = clip_identity(model_base, model_base.visited_loras)
+
     final_refiner_unet = model_refiner.unet_with_lora
     final_refiner_vae = model_refiner.vae
 
@@ -275,6 +468,35 @@ refresh_everything(
 )
 
 
+# samplers whose only randomness is the initial noise and the per-sample BrownianTree, so a batch of
+# seeds produces the same noise as sampling every seed alone
+batch_safe_samplers = ['euler', 'heun', 'heunpp2', 'dpm_2', 'lms', 'dpmpp_2m', 'dpmpp_sde', 'dpmpp_sde_gpu',
+                       'dpmpp_2m_sde', 'dpmpp_2m_sde_gpu', 'dpmpp_3m_sde', 'dpmpp_3m_sde_gpu',
+                       'ddim', 'uni_pc', 'uni_pc_bh2']
+
+
+def cond_batch_key(cond):
+    """Conds with equal keys can be stacked into one batch."""
+    return tuple((tuple(c.shape), tuple(p['pooled_output'].shape) if 'pooled_output' in p else None)
+                 for c, p in cond)
+
+
+@torch.no_grad()
+@torch.inference_mode()
+def stack_conds(conds):
+    assert len(set(cond_batch_key(cond) for cond in conds)) == 1, 'Only conds of equal shape can be batched.'
+    results = []
+
+    for entries in zip(*conds):
+        c = torch.cat([e[0] for e in entries], dim=0)
+        p = {}
+        if 'pooled_output' in entries[0][1]:
+            p['pooled_output'] = torch.cat([e[1]['pooled_output'] for e in entries], dim=0)
+        results.append([c, p])
+
+    return results
+
+
 @torch.no_grad()
 @torch.inference_mode()
 def vae_parse(latent):
@@ -333,7 +555,7 @@ def get_candidate_vae(steps, switch, denoise=1.0, refiner_swap_method='joint'):
 
 @torch.no_grad()
 @torch.inference_mode()
-def process_diffusion(positive_cond, negative_cond, steps, switch, width, height, image_seed, callback, sampler_name, scheduler_name, latent=None, denoise=1.0, tiled=False, cfg_scale=7.0, refiner_swap_method='joint', disable_preview=False):
+def process_diffusion(positive_cond, negative_cond, steps, switch, width, height, image_seed, callback, sampler_name, scheduler_name, latent=None, denoise=1.0, tiled=False, cfg_scale=7.0, refiner_swap_method='joint', disable_preview=False, preview_policy=None):
     target_unet, target_vae, target_refiner_unet, target_refiner_vae, target_clip \
         = final_unet, final_vae, final_refiner_unet, final_refiner_vae, final_clip
 
@@ -358,8 +580,11 @@ def process_diffusion(positive_cond, negative_cond, steps, switch, width, height
 
     print(f'[Sampler] refiner_swap_method = {refiner_swap_method}')
 
+    # a list of seeds samples them as one batch, the conds must already be stacked to the same batch size
+    batch_size = len(image_seed) if isinstance(image_seed, list) else 1
+
     if latent is None:
-        initial_latent = core.generate_empty_latent(width=width, height=height, batch_size=1)
+        initial_latent = core.generate_empty_latent(width=width, height=height, batch_size=batch_size)
     else:
         initial_latent = latent
 
@@ -392,7 +617,8 @@ def process_diffusion(positive_cond, negative_cond, steps, switch, width, height
             refiner_switch=switch,
             previewer_start=0,
             previewer_end=steps,
-            disable_preview=disable_preview
+            disable_preview=disable_preview,
+            preview_policy=preview_policy
         )
         decoded_latent = core.decode_vae(vae=target_vae, latent_image=sampled_latent, tiled=tiled)
 
@@ -411,7 +637,8 @@ def process_diffusion(positive_cond, negative_cond, steps, switch, width, height
             scheduler=scheduler_name,
             previewer_start=0,
             previewer_end=steps,
-            disable_preview=disable_preview
+            disable_preview=disable_preview,
+            preview_policy=preview_policy
         )
         print('Refiner swapped by changing ksampler. Noise preserved.')
 
@@ -434,7 +661,8 @@ def process_diffusion(positive_cond, negative_cond, steps, switch, width, height
             scheduler=scheduler_name,
             previewer_start=switch,
             previewer_end=steps,
-            disable_preview=disable_preview
+            disable_preview=disable_preview,
+            preview_policy=preview_policy
         )
 
         target_model = target_refiner_vae
@@ -462,7 +690,8 @@ def process_diffusion(positive_cond, negative_cond, steps, switch, width, height
             scheduler=scheduler_name,
             previewer_start=0,
             previewer_end=steps,
-            disable_preview=disable_preview
+            disable_preview=disable_preview,
+            preview_policy=preview_policy
         )
         print('Fooocus VAE-based swap.')
 
@@ -492,7 +721,7 @@ def process_diffusion(positive_cond, negative_cond, steps, switch, width, height
             negative=clip_separate(negative_cond, target_model=target_model.model, target_clip=target_clip),
             latent=sampled_latent,
             steps=len_sigmas, start_step=0, last_step=len_sigmas, disable_noise=False, force_full_denoise=True,
-            seed=image_seed+1,
+            seed=[s + 1 for s in image_seed] if isinstance(image_seed, list) else image_seed + 1,
             denoise=denoise,
             callback_function=callback,
             cfg=cfg_scale,
@@ -502,7 +731,8 @@ def process_diffusion(positive_cond, negative_cond, steps, switch, width, height
             previewer_end=steps,
             sigmas=sigmas,
             noise_mean=noise_mean,
-            disable_preview=disable_preview
+            disable_preview=disable_preview,
+            preview_policy=preview_policy
         )
 
         target_model = target_refiner_vae
@@ -1,4 +1,6 @@
 import os
+import threading
+import time
 from ast import literal_eval
 
 
@@ -9,17 +11,72 @@ def makedirs_with_log(path):
         print(f'Directory {path} could not be created, reason: {error}')
 
 
+class DirectorySnapshot:
+    """Cached listing of a directory tree, one entry per directory keyed by its mtime.
+
+    A directory is only listed again when its own mtime changed, so a rescan costs one stat per
+    directory and re-lists just the directories whose entries were added, removed or renamed.
+    """
+
+    # listings of directories modified this recently are not trusted, filesystems with coarse
+    # mtimes could hide a change made in the same tick
+    settle_time_ns = 2 * 10 ** 9
+
+    def __init__(self):
+        self.entries = {}
+        self.lock = threading.Lock()
+
+    def list_directory(self, path):
+        stat = os.stat(path)
+        with self.lock:
+            entry = self.entries.get(path)
+        if entry is not None and entry[0] == stat.st_mtime_ns:
+            return entry[1], entry[2]
+
+        files, subdirectories = [], []
+        with os.scandir(path) as it:
+            for dir_entry in it:
+                try:
+                    is_dir = dir_entry.is_dir()
+                except OSError:
+                    is_dir = False
+                if not is_dir:
+                    files.append(dir_entry.name)
+                elif not dir_entry.is_symlink():
+                    # like os.walk, symlinked directories are not followed
+                    subdirectories.append(dir_entry.name)
+        files.sort(key=lambda s: s.casefold())
+
+        if time.time_ns() - stat.st_mtime_ns > self.settle_time_ns:
+            with self.lock:
+                self.entries[path] = (stat.st_mtime_ns, files, subdirectories)
+        return files, subdirectories
+
+    def walk(self, folder_path, relative_path=''):
+        """Yields (relative_path, sorted files) in the bottom-up order of os.walk(topdown=False)."""
+        try:
+            files, subdirectories = self.list_directory(os.path.join(folder_path, relative_path))
+        except OSError:
+            return
+        for name in subdirectories:
+            yield from self.walk(folder_path, os.path.join(relative_path, name))
+        yield relative_path, files
+
+    def directories(self, folder_path):
+        return [os.path.join(folder_path, relative_path) for relative_path, _ in self.walk(folder_path)]
+
+
+directory_snapshot = DirectorySnapshot()
+
+
 def get_files_from_folder(folder_path, extensions=None, name_filter=None):
     if not os.path.isdir(folder_path):
         raise ValueError("Folder path is not a valid directory.")
 
     filenames = []
 
-    for root, _, files in os.walk(folder_path, topdown=False):
-        relative_path = os.path.relpath(root, folder_path)
-        if relative_path == ".":
-            relative_path = ""
-        for filename in sorted(files, key=lambda s: s.casefold()):
+    for relative_path, files in directory_snapshot.walk(folder_path):
+        for filename in files:
             _, file_extension = os.path.splitext(filename)
             if (extensions is None or file_extension.lower() in extensions) and (name_filter is None or name_filter in _):
                 path = os.path.join(relative_path, filename)
@@ -28,6 +85,62 @@ def get_files_from_folder(folder_path, extensions=None, name_filter=None):
     return filenames
 
 
+class FolderWatcher:
+    """Calls on_change from a background thread when files are added, removed or renamed below folders.
+
+    Needs the optional inotify_simple package (Linux). start() returns False when it is not available.
+    """
+
+    def __init__(self, folders, on_change, debounce=1.0):
+        self.folders = [f for f in folders if os.path.isdir(f)]
+        self.on_change = on_change
+        self.debounce = debounce
+        self.inotify = None
+        self.watched = set()
+        self.thread = None
+
+    @property
+    def alive(self):
+        return self.thread is not None and self.thread.is_alive()
+
+    def start(self):
+        try:
+            from inotify_simple import INotify
+        except ImportError:
+            print('[Folder Watcher] inotify_simple is not installed, model folders are not watched.')
+            return False
+
+        self.inotify = INotify()
+        self.add_watches()
+        self.thread = threading.Thread(target=self.loop, daemon=True)
+        self.thread.start()
+        return True
+
+    def add_watches(self):
+        from inotify_simple import flags
+        mask = flags.CREATE | flags.DELETE | flags.MOVED_FROM | flags.MOVED_TO | flags.CLOSE_WRITE
+        for folder in self.folders:
+            for directory in directory_snapshot.directories(folder):
+                if directory not in self.watched:
+                    try:
+                        self.inotify.add_watch(directory, mask)
+                        self.watched.add(directory)
+                    except OSError as e:
+                        print(f'[Folder Watcher] Cannot watch {directory}: {e}')
+
+    def loop(self):
+        while True:
+            # read_delay collects the burst of events of a copy or an extraction into one refresh
+            events = self.inotify.read(read_delay=int(self.debounce * 1000))
+            if len(events) == 0:
+                continue
+            try:
+                self.on_change()
+                self.add_watches()
+            except Exception as e:
+                print(f'[Folder Watcher] Refresh failed: {e}')
+
+
 def try_eval_env_var(value: str, expected_type=None):
     try:
         value_eval = value
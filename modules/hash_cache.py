@@ -1,61 +1,142 @@
 import json
 import os
+import sqlite3
+import threading
+import time
 from concurrent.futures import ThreadPoolExecutor
 from multiprocessing import cpu_count
 
 import args_manager
+import shared
 from modules.util import sha256, HASH_SHA256_LENGTH, get_file_from_folder_list
 
-hash_cache_filename = 'hash_cache.txt'
+hash_cache_filename = 'hash_cache.db'
+legacy_hash_cache_filename = 'hash_cache.txt'
+
+# filepath -> (size, mtime_ns, inode, hash), mirrors the rows of the sqlite index
 hash_cache = {}
+hash_cache_lock = threading.RLock()
+hashing_in_progress = {}
+connection = None
+
+
+def file_key(filepath):
+    stat = os.stat(filepath)
+    return stat.st_size, stat.st_mtime_ns, stat.st_ino
+
+
+def get_connection():
+    global connection
+
+    with hash_cache_lock:
+        if connection is None:
+            # several worker processes may share the index, sqlite serializes their writes
+            connection = sqlite3.connect(hash_cache_filename, timeout=30, check_same_thread=False)
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('CREATE TABLE IF NOT EXISTS hashes (path TEXT PRIMARY KEY, size INTEGER NOT NULL, '
+                               'mtime_ns INTEGER NOT NULL, inode INTEGER NOT NULL, hash TEXT NOT NULL)')
+            connection.commit()
+        return connection
+
+
+def lookup(filepath, key):
+    with hash_cache_lock:
+        entry = hash_cache.get(filepath)
+        if entry is not None and entry[:3] == key:
+            return entry[3]
+
+        # another process may have hashed the file since the index was loaded
+        try:
+            row = get_connection().execute('SELECT size, mtime_ns, inode, hash FROM hashes WHERE path = ?',
+                                           (filepath,)).fetchone()
+        except sqlite3.Error as e:
+            print(f'[Cache] Lookup failed: {e}')
+            return None
+        if row is not None and tuple(row[:3]) == key:
+            hash_cache[filepath] = tuple(row)
+            return row[3]
+        return None
 
 
 def sha256_from_cache(filepath):
-    global hash_cache
-    if filepath not in hash_cache:
+    key = file_key(filepath)
+
+    while True:
+        with hash_cache_lock:
+            hash_value = lookup(filepath, key)
+            if hash_value is not None:
+                return hash_value
+            event = hashing_in_progress.get(filepath)
+            if event is None:
+                event = hashing_in_progress[filepath] = threading.Event()
+                break
+        # the file is being hashed by another thread, wait for it and check the result
+        event.wait()
+
+    try:
         print(f"[Cache] Calculating sha256 for {filepath}")
         hash_value = sha256(filepath)
         print(f"[Cache] sha256 for {filepath}: {hash_value}")
-        hash_cache[filepath] = hash_value
-        save_cache_to_file(filepath, hash_value)
-
-    return hash_cache[filepath]
+        # only index the hash if the file did not change while it was read
+        if file_key(filepath) == key:
+            save_cache_to_file(filepath, key, hash_value)
+        return hash_value
+    finally:
+        with hash_cache_lock:
+            hashing_in_progress.pop(filepath).set()
 
 
 def load_cache_from_file():
     global hash_cache
 
     try:
-        if os.path.exists(hash_cache_filename):
-            with open(hash_cache_filename, 'rt', encoding='utf-8') as fp:
-                for line in fp:
-                    entry = json.loads(line)
-                    for filepath, hash_value in entry.items():
-                        if not os.path.exists(filepath) or not isinstance(hash_value, str) and len(hash_value) != HASH_SHA256_LENGTH:
-                            print(f'[Cache] Skipping invalid cache entry: {filepath}')
-                            continue
-                        hash_cache[filepath] = hash_value
+        migrate = not os.path.exists(hash_cache_filename) and os.path.exists(legacy_hash_cache_filename)
+        conn = get_connection()
+        if migrate:
+            migrate_legacy_cache(conn)
+
+        rows = conn.execute('SELECT path, size, mtime_ns, inode, hash FROM hashes').fetchall()
+        missing = []
+        with hash_cache_lock:
+            for filepath, size, mtime_ns, inode, hash_value in rows:
+                if not os.path.exists(filepath):
+                    missing.append((filepath,))
+                    continue
+                hash_cache[filepath] = (size, mtime_ns, inode, hash_value)
+
+        if len(missing) > 0:
+            with conn:
+                conn.executemany('DELETE FROM hashes WHERE path = ?', missing)
+            print(f'[Cache] Removed {len(missing)} entries of deleted files')
     except Exception as e:
         print(f'[Cache] Loading failed: {e}')
 
 
-def save_cache_to_file(filename=None, hash_value=None):
-    global hash_cache
+def migrate_legacy_cache(conn):
+    """Imports the path keyed JSON lines of hash_cache.txt, trusting the files did not change since."""
+    rows = []
+    with open(legacy_hash_cache_filename, 'rt', encoding='utf-8') as fp:
+        for line in fp:
+            entry = json.loads(line)
+            for filepath, hash_value in entry.items():
+                if not os.path.exists(filepath) or not isinstance(hash_value, str) or len(hash_value) != HASH_SHA256_LENGTH:
+                    print(f'[Cache] Skipping invalid cache entry: {filepath}')
+                    continue
+                rows.append((filepath, *file_key(filepath), hash_value))
 
-    if filename is not None and hash_value is not None:
-        items = [(filename, hash_value)]
-        mode = 'at'
-    else:
-        items = sorted(hash_cache.items())
-        mode = 'wt'
+    with conn:
+        conn.executemany('INSERT OR REPLACE INTO hashes VALUES (?, ?, ?, ?, ?)', rows)
+    print(f'[Cache] Migrated {len(rows)} entries from {legacy_hash_cache_filename}')
 
-    try:
-        with open(hash_cache_filename, mode, encoding='utf-8') as fp:
-            for filepath, hash_value in items:
-                json.dump({filepath: hash_value}, fp)
-                fp.write('\n')
-    except Exception as e:
-        print(f'[Cache] Saving failed: {e}')
+
+def save_cache_to_file(filepath, key, hash_value):
+    with hash_cache_lock:
+        hash_cache[filepath] = (*key, hash_value)
+        try:
+            with get_connection() as conn:
+                conn.execute('INSERT OR REPLACE INTO hashes VALUES (?, ?, ?, ?, ?)', (filepath, *key, hash_value))
+        except sqlite3.Error as e:
+            print(f'[Cache] Saving failed: {e}')
 
 
 def init_cache(model_filenames, paths_checkpoints, lora_filenames, paths_loras):
@@ -63,16 +144,29 @@ def init_cache(model_filenames, paths_checkpoints, lora_filenames, paths_loras):
 
     if args_manager.args.rebuild_hash_cache:
         max_workers = args_manager.args.rebuild_hash_cache if args_manager.args.rebuild_hash_cache > 0 else cpu_count()
-        rebuild_cache(lora_filenames, model_filenames, paths_checkpoints, paths_loras, max_workers)
+        threading.Thread(target=rebuild_cache_when_ready, daemon=True,
+                         args=(lora_filenames, model_filenames, paths_checkpoints, paths_loras, max_workers)).start()
+
+
+def wait_for_ui(timeout=600):
+    deadline = time.perf_counter() + timeout
+    while getattr(shared.gradio_root, 'local_url', None) is None and time.perf_counter() < deadline:
+        time.sleep(1)
+
 
-    # write cache to file again for sorting and cleanup of invalid cache entries
-    save_cache_to_file()
+def rebuild_cache_when_ready(lora_filenames, model_filenames, paths_checkpoints, paths_loras, max_workers):
+    # hashing reads every model file, do not compete with the UI startup for disk bandwidth
+    wait_for_ui()
+    rebuild_cache(lora_filenames, model_filenames, paths_checkpoints, paths_loras, max_workers)
 
 
 def rebuild_cache(lora_filenames, model_filenames, paths_checkpoints, paths_loras, max_workers=cpu_count()):
     def thread(filename, paths):
-        filepath = get_file_from_folder_list(filename, paths)
-        sha256_from_cache(filepath)
+        try:
+            filepath = get_file_from_folder_list(filename, paths)
+            sha256_from_cache(filepath)
+        except Exception as e:
+            print(f'[Cache] Hashing {filename} failed: {e}')
 
     print('[Cache] Rebuilding hash cache')
     with ThreadPoolExecutor(max_workers=max_workers) as executor:
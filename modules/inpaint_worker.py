@@ -1,5 +1,7 @@
+import math
 import torch
 import numpy as np
+import args_manager
 
 from PIL import Image, ImageFilter
 from modules.util import resample_image, set_image_shape_ceil, get_image_shape_ceil
@@ -83,11 +85,14 @@ def regulate_abcd(x, a, b, c, d):
 
 
 def compute_initial_abcd(x):
-    indices = np.where(x)
-    a = np.min(indices[0])
-    b = np.max(indices[0])
-    c = np.min(indices[1])
-    d = np.max(indices[1])
+    rows = np.any(x, axis=1)
+    columns = np.any(x, axis=0)
+    if not rows.any():
+        raise ValueError('The mask is empty.')
+    a = np.argmax(rows)
+    b = len(rows) - 1 - np.argmax(rows[::-1])
+    c = np.argmax(columns)
+    d = len(columns) - 1 - np.argmax(columns[::-1])
     abp = (b + a) // 2
     abm = (b - a) // 2
     cdp = (d + c) // 2
@@ -101,52 +106,127 @@ def compute_initial_abcd(x):
     return a, b, c, d
 
 
+def grow_steps(size, low_room, high_room, target):
+    # Smallest number of steps growing a span by one pixel on each side (as long as there is room)
+    # until it is at least target, capped at the number of steps that fill the whole axis.
+    p, q = min(low_room, high_room), max(low_room, high_room)
+    if target <= size:
+        return 0
+    if target <= size + 2 * p:
+        m = math.ceil((target - size) / 2)
+    else:
+        m = math.ceil(target - size - p)
+    return min(m, q)
+
+
 def solve_abcd(x, a, b, c, d, k):
+    # Closed form of growing the smaller side of the box by one pixel per side until the box covers
+    # k of the image height and width. Growing the sides is a merge of the two sequences of sizes,
+    # so the box is the one right after the later of the two last required steps. Expects a box
+    # inside the image, as compute_initial_abcd returns.
     k = float(k)
     assert 0.0 <= k <= 1.0
 
     H, W = x.shape[:2]
     if k == 1.0:
         return 0, H, 0, W
-    while True:
-        if b - a >= H * k and d - c >= W * k:
-            break
 
-        add_h = (b - a) < (d - c)
-        add_w = not add_h
+    h, w = b - a, d - c
+    steps_h = grow_steps(h, a, H - b, H * k)
+    steps_w = grow_steps(w, c, W - d, W * k)
 
-        if b - a == H:
-            add_w = True
+    def grown(size, low_room, high_room, m):
+        return size + min(m, low_room) + min(m, high_room)
 
-        if d - c == W:
-            add_h = True
+    last_h = grown(h, a, H - b, steps_h - 1) if steps_h > 0 else None
+    last_w = grown(w, c, W - d, steps_w - 1) if steps_w > 0 else None
 
-        if add_h:
-            a -= 1
-            b += 1
+    if last_h is not None and (last_w is None or last_h >= last_w):
+        # ties grow the width first, so every width step up to the size of the last height step came before it
+        steps_w = grow_steps(w, c, W - d, last_h + 1)
+    elif last_w is not None:
+        steps_h = grow_steps(h, a, H - b, last_w)
 
-        if add_w:
-            c -= 1
-            d += 1
+    return regulate_abcd(x, a - steps_h, b + steps_h, c - steps_w, d + steps_w)
 
-        a, b, c, d = regulate_abcd(x, a, b, c, d)
-    return a, b, c, d
 
+fooocus_fill_schedule = [(512, 2), (256, 2), (128, 4), (64, 4), (33, 8), (15, 8), (5, 16), (3, 16)]
 
-def fooocus_fill(image, mask):
+
+def fooocus_fill_blur(image, mask):
     current_image = image.copy()
-    raw_image = image.copy()
-    area = np.where(mask < 127)
-    store = raw_image[area]
+    known = (mask < 127)[..., None]
 
-    for k, repeats in [(512, 2), (256, 2), (128, 4), (64, 4), (33, 8), (15, 8), (5, 16), (3, 16)]:
+    for k, repeats in fooocus_fill_schedule:
         for _ in range(repeats):
             current_image = box_blur(current_image, k)
-            current_image[area] = store
+            np.copyto(current_image, image, where=known)
+
+    return current_image
+
+
+def fooocus_fill_pyramid(image, mask, min_radius=1.5, max_level=5):
+    # Runs the blur schedule of fooocus_fill_blur on a pyramid. Each blur runs on the coarsest level
+    # (halving the size up to max_level times) where its radius stays at least min_radius, so most
+    # passes touch a fraction of the pixels. The result is upsampled from level to level.
+    H, W = image.shape[:2]
+    known = mask < 127
+
+    def level_of(k):
+        level = 0
+        while level < max_level and k / 2 ** (level + 1) >= min_radius:
+            level += 1
+        return level
+
+    current_image = None
+    for level in sorted({level_of(k) for k, _ in fooocus_fill_schedule}, reverse=True):
+        scale = 2 ** level
+        h, w = max(1, round(H / scale)), max(1, round(W / scale))
+
+        if level == 0:
+            level_image, level_known = image, known
+        else:
+            # a coarse pixel is known when most of its area is, and takes the average of the known part
+            weight = cv2.resize(known.astype(np.float32), (w, h), interpolation=cv2.INTER_AREA)
+            level_image = cv2.resize(image.astype(np.float32) * known[..., None], (w, h), interpolation=cv2.INTER_AREA)
+            level_image /= np.maximum(weight, 1e-6)[..., None]
+            level_image = level_image.round().clip(0, 255).astype(np.uint8)
+            level_known = weight >= 0.5
+
+        if current_image is None:
+            # like the full size fill, the masked area starts from the original content
+            current_image = image.copy() if level == 0 else cv2.resize(image, (w, h), interpolation=cv2.INTER_AREA)
+        else:
+            current_image = cv2.resize(current_image, (w, h), interpolation=cv2.INTER_LINEAR)
+
+        level_known = level_known[..., None]
+        np.copyto(current_image, level_image, where=level_known)
+        for k, repeats in fooocus_fill_schedule:
+            if level_of(k) != level:
+                continue
+            for _ in range(repeats):
+                current_image = box_blur(current_image, max(1, round(k / scale)))
+                np.copyto(current_image, level_image, where=level_known)
+
+    if current_image.shape[:2] != (H, W):
+        current_image = cv2.resize(current_image, (W, H), interpolation=cv2.INTER_LINEAR)
+        np.copyto(current_image, image, where=known[..., None])
 
     return current_image
 
 
+fooocus_fill_methods = {
+    'blur': fooocus_fill_blur,
+    'pyramid': fooocus_fill_pyramid
+}
+
+
+def fooocus_fill(image, mask, method=None):
+    if method is None:
+        method = args_manager.args.inpaint_fill
+    return fooocus_fill_methods[method](image, mask)
+
+
 class InpaintWorker:
     def __init__(self, image, mask, use_fill=True, k=0.618):
         a, b, c, d = compute_initial_abcd(mask > 0)
@@ -0,0 +1,93 @@
+import threading
+from collections import OrderedDict
+
+
+class LRUCache:
+    """Byte-budgeted LRU mapping with hit/miss/eviction counters.
+
+    size_fn returns the size of a value in bytes. Values larger than the whole budget are
+    not stored. on_evict is called with (key, value) for every entry pushed out of the cache.
+    """
+
+    def __init__(self, budget_bytes, size_fn, on_evict=None, name='Cache'):
+        self.budget_bytes = int(budget_bytes)
+        self.size_fn = size_fn
+        self.on_evict = on_evict
+        self.name = name
+        self.entries = OrderedDict()
+        self.sizes = {}
+        self.used_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.lock = threading.RLock()
+
+    @property
+    def enabled(self):
+        return self.budget_bytes > 0
+
+    def get(self, key, default=None):
+        with self.lock:
+            if key in self.entries:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return self.entries[key]
+            self.misses += 1
+            return default
+
+    def put(self, key, value, size=None):
+        if not self.enabled:
+            return False
+
+        with self.lock:
+            if key in self.entries:
+                self._remove(key)
+
+            size = self.size_fn(value) if size is None else size
+            if size > self.budget_bytes:
+                return False
+
+            self.entries[key] = value
+            self.sizes[key] = size
+            self.used_bytes += size
+
+            while self.used_bytes > self.budget_bytes:
+                old_key, old_value = self._remove(next(iter(self.entries)))
+                self.evictions += 1
+                if self.on_evict is not None:
+                    self.on_evict(old_key, old_value)
+            return True
+
+    def pop(self, key, default=None):
+        with self.lock:
+            if key not in self.entries:
+                return default
+            return self._remove(key)[1]
+
+    def _remove(self, key):
+        value = self.entries.pop(key)
+        self.used_bytes -= self.sizes.pop(key)
+        return key, value
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.sizes.clear()
+            self.used_bytes = 0
+
+    def stats(self):
+        with self.lock:
+            return dict(
+                entries=len(self.entries),
+                used_bytes=self.used_bytes,
+                budget_bytes=self.budget_bytes,
+                hits=self.hits,
+                misses=self.misses,
+                evictions=self.evictions
+            )
+
+    def __contains__(self, key):
+        return key in self.entries
+
+    def __len__(self):
+        return len(self.entries)
@@ -15,6 +15,7 @@ import ldm_patched.modules.model_patcher
 import ldm_patched.modules.samplers
 import ldm_patched.modules.sd
 import ldm_patched.modules.sd1_clip
+import ldm_patched.modules.sdxl_clip
 import ldm_patched.modules.clip_vision
 import ldm_patched.modules.ops as ops
 
@@ -62,6 +63,69 @@ def patched_encode_token_weights(self, token_weight_pairs):
     return torch.cat(output, dim=-2).to(ldm_patched.modules.model_management.intermediate_device()), first_pooled
 
 
+def patched_encode_token_weights_batch(self, batch_token_weight_pairs):
+    # Same as patched_encode_token_weights for a list of prompts, but all sections of all
+    # prompts go through the text encoder in a single forward pass.
+    to_encode = list()
+    spans = list()
+    max_token_len = 0
+    for token_weight_pairs in batch_token_weight_pairs:
+        start = len(to_encode)
+        has_weights = False
+        for x in token_weight_pairs:
+            tokens = list(map(lambda a: a[0], x))
+            max_token_len = max(len(tokens), max_token_len)
+            has_weights = has_weights or not all(map(lambda a: a[1] == 1.0, x))
+            to_encode.append(tokens)
+        spans.append((start, len(to_encode) - start, has_weights))
+
+    if any(has_weights or sections == 0 for _, sections, has_weights in spans):
+        to_encode.append(ldm_patched.modules.sd1_clip.gen_empty_tokens(self.special_tokens, max_token_len))
+
+    out, pooled = self.encode(to_encode)
+    intermediate_device = ldm_patched.modules.model_management.intermediate_device()
+
+    results = []
+    for (start, sections, has_weights), token_weight_pairs in zip(spans, batch_token_weight_pairs):
+        if pooled is not None:
+            first_pooled = pooled[start:start + 1] if sections > 0 else pooled[-1:]
+            first_pooled = first_pooled.to(intermediate_device)
+        else:
+            first_pooled = pooled
+
+        output = []
+        for k in range(0, sections):
+            z = out[start + k:start + k + 1]
+            if has_weights:
+                original_mean = z.mean()
+                z_empty = out[-1]
+                for i in range(len(z)):
+                    for j in range(len(z[i])):
+                        weight = token_weight_pairs[k][j][1]
+                        if weight != 1.0:
+                            z[i][j] = (z[i][j] - z_empty[j]) * weight + z_empty[j]
+                new_mean = z.mean()
+                z = z * (original_mean / new_mean)
+            output.append(z)
+
+        if len(output) == 0:
+            results.append((out[-1:].to(intermediate_device), first_pooled))
+        else:
+            results.append((torch.cat(output, dim=-2).to(intermediate_device), first_pooled))
+
+    return results
+
+
+def patched_SD1ClipModel_encode_token_weights_batch(self, batch_token_weight_pairs):
+    return getattr(self, self.clip).encode_token_weights_batch([x[self.clip_name] for x in batch_token_weight_pairs])
+
+
+def patched_SDXLClipModel_encode_token_weights_batch(self, batch_token_weight_pairs):
+    g_results = self.clip_g.encode_token_weights_batch([x["g"] for x in batch_token_weight_pairs])
+    l_results = self.clip_l.encode_token_weights_batch([x["l"] for x in batch_token_weight_pairs])
+    return [(torch.cat([l_out, g_out], dim=-1), g_pooled) for (g_out, g_pooled), (l_out, _) in zip(g_results, l_results)]
+
+
 def patched_SDClipModel__init__(self, max_length=77, freeze=True, layer="last", layer_idx=None,
                                 textmodel_json_config=None, dtype=None, special_tokens=None,
                                 layer_norm_hidden_state=True, **kwargs):
@@ -188,6 +252,9 @@ def patched_ClipVisionModel_encode_image(self, image):
 
 def patch_all_clip():
     ldm_patched.modules.sd1_clip.ClipTokenWeightEncoder.encode_token_weights = patched_encode_token_weights
+    ldm_patched.modules.sd1_clip.ClipTokenWeightEncoder.encode_token_weights_batch = patched_encode_token_weights_batch
+    ldm_patched.modules.sd1_clip.SD1ClipModel.encode_token_weights_batch = patched_SD1ClipModel_encode_token_weights_batch
+    ldm_patched.modules.sdxl_clip.SDXLClipModel.encode_token_weights_batch = patched_SDXLClipModel_encode_token_weights_batch
     ldm_patched.modules.sd1_clip.SDClipModel.__init__ = patched_SDClipModel__init__
     ldm_patched.modules.sd1_clip.SDClipModel.forward = patched_SDClipModel_forward
     ldm_patched.modules.clip_vision.ClipVisionModel.__init__ = patched_ClipVisionModel__init__
@@ -0,0 +1,92 @@
+import hashlib
+import os
+
+import numpy as np
+import torch
+
+import args_manager
+from modules.core import tensors_size
+from modules.model_cache import LRUCache
+
+
+def value_size(value):
+    if isinstance(value, np.ndarray):
+        return value.nbytes
+    return tensors_size(value)
+
+
+# ControlNet hints (uint8 arrays) and IP-Adapter conditions (CPU tensors), keyed by the content of the
+# input image and every parameter that changes the result
+preprocess_cache = LRUCache(int(args_manager.args.preprocess_cache_size * 1024 ** 2), value_size,
+                            name='Preprocess Cache')
+
+
+def image_digest(image):
+    image = np.ascontiguousarray(image)
+    return hashlib.blake2b(image.data, digest_size=16).hexdigest() + str(image.shape) + str(image.dtype)
+
+
+def file_identity(path):
+    if not isinstance(path, str):
+        return None
+    try:
+        return path, os.stat(path).st_mtime_ns
+    except OSError:
+        return None
+
+
+def disk_cache_path(key):
+    if args_manager.args.preprocess_cache_path is None:
+        return None
+    name = hashlib.sha256(repr(key).encode('utf-8')).hexdigest()
+    return os.path.join(args_manager.args.preprocess_cache_path, name[:2], f'{name}.pt')
+
+
+def load_from_disk(key):
+    path = disk_cache_path(key)
+    if path is None or not os.path.exists(path):
+        return None
+    try:
+        value = torch.load(path, map_location='cpu', weights_only=True)
+        if isinstance(value, dict) and 'array' in value:
+            value = value['array'].numpy()
+        return value
+    except Exception as e:
+        print(f'[Preprocess Cache] Failed to read {path}: {e}')
+        return None
+
+
+def save_to_disk(key, value):
+    path = disk_cache_path(key)
+    if path is None:
+        return
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        temp_path = f'{path}.{os.getpid()}.tmp'
+        torch.save(dict(array=torch.from_numpy(value)) if isinstance(value, np.ndarray) else value, temp_path)
+        os.replace(temp_path, path)
+    except Exception as e:
+        print(f'[Preprocess Cache] Failed to write {path}: {e}')
+
+
+def cached(kind, image, params, compute):
+    """Returns compute() for this image and params, reusing an earlier result with the same content.
+
+    kind names the preprocessor, params is a tuple of everything else the result depends on. Cached
+    arrays are made read-only since the same object is handed to every caller.
+    """
+    key = (kind, image_digest(image), params)
+
+    value = preprocess_cache.get(key)
+    if value is not None:
+        return value
+
+    value = load_from_disk(key)
+    if value is None:
+        value = compute()
+        save_to_disk(key, value)
+
+    if isinstance(value, np.ndarray):
+        value.setflags(write=False)
+    preprocess_cache.put(key, value)
+    return value
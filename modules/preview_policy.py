@@ -0,0 +1,46 @@
+import math
+import time
+
+import torch
+
+
+class PreviewPolicy:
+    """Decides on which sampling steps the previewer runs and at which size.
+
+    A preview is only decoded when the consumer of the yield channel took the previous one and at
+    most max_fps times per second; the last step is always decoded. With max_size the latent is
+    average pooled before decoding so the preview is at most max_size pixels on its longest side.
+    """
+
+    def __init__(self, channel=None, max_fps=0.0, max_size=0):
+        self.channel = channel
+        self.max_fps = max_fps
+        self.max_size = max_size
+        self.last_decode_time = 0.0
+        self.decoded = 0
+        self.skipped = 0
+
+    def should_decode(self, step, total_steps):
+        now = time.perf_counter()
+        last_step = step >= total_steps - 1
+        ready = self.channel is None or self.channel.preview_consumed()
+        throttled = self.max_fps > 0 and now - self.last_decode_time < 1.0 / self.max_fps
+
+        if not last_step and (not ready or throttled):
+            self.skipped += 1
+            return False
+
+        self.last_decode_time = now
+        self.decoded += 1
+        return True
+
+    def prepare(self, x0):
+        # only the first sample of a batch is shown
+        x0 = x0[:1]
+        if self.max_size <= 0:
+            return x0
+        # latents are 1/8 of the image size
+        factor = math.ceil(max(x0.shape[-2:]) * 8 / self.max_size)
+        if factor <= 1:
+            return x0
+        return torch.nn.functional.avg_pool2d(x0, factor, ceil_mode=True)
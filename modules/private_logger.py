@@ -1,8 +1,13 @@
+import atexit
 import os
+import re
+import threading
+import traceback
 import args_manager
 import modules.config
 import json
 import urllib.parse
+from concurrent.futures import ThreadPoolExecutor, wait
 
 from PIL import Image
 from PIL.PngImagePlugin import PngInfo
@@ -10,7 +15,75 @@ from modules.flags import OutputFormat
 from modules.meta_parser import MetadataParser, get_exif
 from modules.util import generate_temp_filename
 
-log_cache = {}
+html_log_marker = '<!--fooocus-log-append-->'
+prepared_logs = set()
+
+
+class ImageWriter:
+    """Encodes and writes images and their log entries on background threads.
+
+    submit() blocks while max_pending writes are outstanding, so the sampler cannot pile up
+    unbounded pixel buffers. Until a write finishes its pixels are available via pending_image().
+    """
+
+    def __init__(self, max_workers, max_pending):
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='image_writer') \
+            if max_workers > 0 else None
+        self.slots = threading.BoundedSemaphore(max(max_pending, 1))
+        self.lock = threading.Lock()
+        self.pending = {}
+
+    def submit(self, path, img, write_fn):
+        if self.executor is None:
+            write_fn()
+            return
+
+        self.slots.acquire()
+        with self.lock:
+            future = self.executor.submit(self.run, path, write_fn)
+            self.pending[path] = (future, img)
+
+    def run(self, path, write_fn):
+        try:
+            write_fn()
+        except Exception:
+            print(f'[Image Writer] Saving {path} failed.')
+            traceback.print_exc()
+        finally:
+            with self.lock:
+                self.pending.pop(path, None)
+            self.slots.release()
+
+    def pending_image(self, path):
+        with self.lock:
+            entry = self.pending.get(path)
+        return entry[1] if entry is not None else None
+
+    def flush(self, paths=None):
+        with self.lock:
+            if paths is None:
+                futures = [future for future, _ in self.pending.values()]
+            else:
+                futures = [self.pending[p][0] for p in paths if isinstance(p, str) and p in self.pending]
+        wait(futures)
+
+    def shutdown(self):
+        if self.executor is not None:
+            self.flush()
+            self.executor.shutdown(wait=True)
+
+
+image_writer = ImageWriter(args_manager.args.image_writer_threads, args_manager.args.image_writer_queue_size)
+atexit.register(image_writer.shutdown)
+html_log_lock = threading.Lock()
+
+
+def displayable(result):
+    """The pixels of a result whose file is still being written, the result itself otherwise."""
+    if not isinstance(result, str):
+        return result
+    img = image_writer.pending_image(result)
+    return result if img is None else img
 
 
 def get_current_html_path(output_format=None):
@@ -27,6 +100,20 @@ def log(img, metadata, metadata_parser: MetadataParser | None = None, output_for
     date_string, local_temp_filename, only_name = generate_temp_filename(folder=path_outputs, extension=output_format)
     os.makedirs(os.path.dirname(local_temp_filename), exist_ok=True)
 
+    metadata = metadata.copy()
+
+    def write():
+        save_image(img, metadata, metadata_parser, output_format, local_temp_filename)
+        if not args_manager.args.disable_image_log:
+            with html_log_lock:
+                write_html_log(metadata, task, date_string, local_temp_filename, only_name)
+
+    # the file name is known right away, encoding and logging happen on the image writer threads
+    image_writer.submit(local_temp_filename, img, write)
+    return local_temp_filename
+
+
+def save_image(img, metadata, metadata_parser, output_format, local_temp_filename):
     parsed_parameters = metadata_parser.to_string(metadata.copy()) if metadata_parser is not None else ''
     image = Image.fromarray(img)
 
@@ -45,11 +132,8 @@ def log(img, metadata, metadata_parser: MetadataParser | None = None, output_for
     else:
         image.save(local_temp_filename)
 
-    if args_manager.args.disable_image_log:
-        return local_temp_filename
-
-    html_name = os.path.join(os.path.dirname(local_temp_filename), 'log.html')
 
+def html_log_header(date_string):
     css_styles = (
         "<style>"
         "body { background-color: #121212; color: #E0E0E0; } "
@@ -63,6 +147,7 @@ def log(img, metadata, metadata_parser: MetadataParser | None = None, output_for
         "hr { border-color: gray; } "
         "button { background-color: black; color: white; border: 1px solid grey; border-radius: 5px; padding: 5px 10px; text-align: center; display: inline-block; font-size: 16px; cursor: pointer; }"
         "button:hover {background-color: grey; color: black;}"
+        "#log-entries { display: flex; flex-direction: column-reverse; }"
         "</style>"
     )
 
@@ -91,18 +176,41 @@ def log(img, metadata, metadata_parser: MetadataParser | None = None, output_for
         </script>"""
     )
 
-    begin_part = f"<!DOCTYPE html><html><head><title>Fooocus Log {date_string}</title>{css_styles}</head><body>{js}<p>Fooocus Log {date_string} (private)</p>\n<p>Metadata is embedded if enabled in the config or developer debug mode. You can find the information for each image in line Metadata Scheme.</p><!--fooocus-log-split-->\n\n"
-    end_part = f'\n<!--fooocus-log-split--></body></html>'
+    # the entries container is left open, new entries are appended to the end of the file and
+    # shown newest first by the column-reverse layout
+    return f"<!DOCTYPE html><html><head><title>Fooocus Log {date_string}</title>{css_styles}</head><body>{js}<p>Fooocus Log {date_string} (private)</p>\n<p>Metadata is embedded if enabled in the config or developer debug mode. You can find the information for each image in line Metadata Scheme.</p>{html_log_marker}<div id=\"log-entries\">\n\n"
 
-    middle_part = log_cache.get(html_name, "")
 
-    if middle_part == "":
-        if os.path.exists(html_name):
-            existing_split = open(html_name, 'r', encoding='utf-8').read().split('<!--fooocus-log-split-->')
-            if len(existing_split) == 3:
-                middle_part = existing_split[1]
-            else:
-                middle_part = existing_split[0]
+def prepare_html_log(html_name, date_string):
+    """Creates the log file, or converts a log written in the old prepend-and-rewrite format once."""
+    if not os.path.exists(html_name):
+        with open(html_name, 'w', encoding='utf-8') as f:
+            f.write(html_log_header(date_string))
+        return
+
+    with open(html_name, 'r', encoding='utf-8') as f:
+        if html_log_marker in f.read(8192):
+            return
+        f.seek(0)
+        existing_split = f.read().split('<!--fooocus-log-split-->')
+
+    middle_part = existing_split[1] if len(existing_split) == 3 else existing_split[0]
+    items = [item for item in re.split(r'(?=<div id=")', middle_part) if item.strip() != '']
+
+    temp_name = html_name + '.tmp'
+    with open(temp_name, 'w', encoding='utf-8') as f:
+        f.write(html_log_header(date_string))
+        # old logs store the newest entry first
+        f.writelines(reversed(items))
+    os.replace(temp_name, html_name)
+
+
+def write_html_log(metadata, task, date_string, local_temp_filename, only_name):
+    html_name = os.path.join(os.path.dirname(local_temp_filename), 'log.html')
+
+    if html_name not in prepared_logs or not os.path.exists(html_name):
+        prepare_html_log(html_name, date_string)
+        prepared_logs.add(html_name)
 
     div_name = only_name.replace('.', '_')
     item = f"<div id=\"{div_name}\" class=\"image-container\"><hr><table><tr>\n"
@@ -125,13 +233,7 @@ def log(img, metadata, metadata_parser: MetadataParser | None = None, output_for
     item += "</td>"
     item += "</tr></table></div>\n\n"
 
-    middle_part = item + middle_part
-
-    with open(html_name, 'w', encoding='utf-8') as f:
-        f.write(begin_part + middle_part + end_part)
+    with open(html_name, 'a', encoding='utf-8') as f:
+        f.write(item)
 
     print(f'Image generated with private log at: {html_name}')
-
-    log_cache[html_name] = middle_part
-
-    return local_temp_filename
@@ -0,0 +1,85 @@
+import threading
+import time
+from contextlib import contextmanager
+
+
+class PooledSession:
+    def __init__(self, session):
+        self.session = session
+        self.lock = threading.Lock()
+        self.last_used = time.monotonic()
+        self.users = 0
+
+
+class SessionPool:
+    """Keeps expensive inference sessions (background removal models etc.) alive between calls.
+
+    Sessions are created by factory() on first use of a key and dropped after idle_timeout seconds
+    without use. A session is used by one caller at a time.
+    """
+
+    def __init__(self, idle_timeout=300, name='Session Pool'):
+        self.idle_timeout = idle_timeout
+        self.name = name
+        self.sessions = {}
+        self.lock = threading.Lock()
+        self.sweeper = None
+        self.created = 0
+        self.reused = 0
+        self.evicted = 0
+
+    @contextmanager
+    def use(self, key, factory):
+        with self.lock:
+            entry = self.sessions.get(key)
+            if entry is None:
+                entry = self.sessions[key] = PooledSession(None)
+            entry.users += 1
+            self.start_sweeper()
+
+        try:
+            with entry.lock:
+                if entry.session is None:
+                    print(f'[{self.name}] Loading {key}')
+                    entry.session = factory()
+                    self.created += 1
+                else:
+                    self.reused += 1
+                yield entry.session
+        finally:
+            with self.lock:
+                entry.users -= 1
+                entry.last_used = time.monotonic()
+
+    def start_sweeper(self):
+        if self.sweeper is None and self.idle_timeout > 0:
+            self.sweeper = threading.Thread(target=self.sweep_loop, daemon=True)
+            self.sweeper.start()
+
+    def sweep_loop(self):
+        while True:
+            time.sleep(max(self.idle_timeout / 4, 1))
+            self.evict_idle()
+
+    def evict_idle(self, now=None):
+        now = time.monotonic() if now is None else now
+        with self.lock:
+            idle = [key for key, entry in self.sessions.items()
+                    if entry.users == 0 and now - entry.last_used >= self.idle_timeout]
+            for key in idle:
+                del self.sessions[key]
+                self.evicted += 1
+        for key in idle:
+            print(f'[{self.name}] Released idle {key}')
+        return idle
+
+    def clear(self):
+        with self.lock:
+            self.sessions = {key: entry for key, entry in self.sessions.items() if entry.users > 0}
+
+    def stats(self):
+        with self.lock:
+            return dict(sessions=len(self.sessions), created=self.created, reused=self.reused, evicted=self.evicted)
+
+
+background_removal_sessions = SessionPool(idle_timeout=300, name='Background Removal')
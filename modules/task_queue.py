@@ -0,0 +1,217 @@
+import threading
+import time
+from collections import deque
+from enum import Enum
+
+
+class TaskState(Enum):
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    DONE = 'done'
+    CANCELLED = 'cancelled'
+
+
+def model_signature(task):
+    """Identifies the model files refresh_everything() has to load for a task.
+
+    A different VAE reloads the base checkpoint. LoRA weights and clip skip are left out, they
+    are applied to the loaded models without reloading any file.
+    """
+    return (getattr(task, 'base_model_name', None),
+            getattr(task, 'refiner_model_name', None),
+            getattr(task, 'vae_name', None),
+            tuple(str(name) for name, weight in getattr(task, 'loras', [])))
+
+
+def preview_image(item):
+    """The image of a ['preview', (percentage, title, image)] item, None for progress-only previews."""
+    payload = item[1]
+    if isinstance(payload, tuple) and len(payload) == 3:
+        return payload[2]
+    return payload
+
+
+class YieldChannel:
+    """Deque-backed producer/consumer channel for the yields of a single task.
+
+    Keeps the list-like surface used by the UI (append, len, [0]) but lets consumers
+    block in pop() until the worker produces something instead of polling.
+    'preview' items go to a single latest-value slot, a newer preview replaces one the
+    consumer has not taken yet, except that a preview without an image only updates the
+    progress of a pending image. Items still come out in the order they were appended.
+    """
+
+    def __init__(self):
+        self._items = deque()
+        self._preview = None
+        self._sequence = 0
+        self._condition = threading.Condition()
+
+    def append(self, item):
+        with self._condition:
+            entry = (self._sequence, item)
+            self._sequence += 1
+            if item[0] == 'preview':
+                pending = self._preview
+                if pending is not None and preview_image(item) is None and preview_image(pending[1]) is not None:
+                    # a progress-only preview must not drop an image the consumer has not seen yet
+                    number, text, _ = item[1]
+                    entry = (pending[0], ['preview', (number, text, preview_image(pending[1]))])
+                self._preview = entry
+            else:
+                self._items.append(entry)
+            self._condition.notify_all()
+
+    def _ordered(self):
+        entries = list(self._items)
+        if self._preview is not None:
+            entries.append(self._preview)
+            entries.sort(key=lambda entry: entry[0])
+        return [item for _, item in entries]
+
+    def pop(self, timeout=None):
+        with self._condition:
+            if not self._condition.wait_for(lambda: len(self) > 0, timeout=timeout):
+                return None
+            if self._preview is not None and (len(self._items) == 0 or self._preview[0] < self._items[0][0]):
+                item = self._preview[1]
+                self._preview = None
+                return item
+            return self._items.popleft()[1]
+
+    def peek(self):
+        with self._condition:
+            items = self._ordered()
+            return items[0] if len(items) > 0 else None
+
+    def preview_consumed(self):
+        """True when the consumer has taken the last preview image, i.e. it is ready for a new one."""
+        with self._condition:
+            return self._preview is None or preview_image(self._preview[1]) is None
+
+    def clear(self):
+        with self._condition:
+            self._items.clear()
+            self._preview = None
+
+    def __len__(self):
+        return len(self._items) + (1 if self._preview is not None else 0)
+
+    def __getitem__(self, index):
+        with self._condition:
+            return self._ordered()[index]
+
+
+scheduler_fifo = 'fifo'
+scheduler_affinity = 'affinity'
+scheduler_policies = [scheduler_fifo, scheduler_affinity]
+
+
+class TaskQueue:
+    """Thread-safe queue of AsyncTasks with condition-variable wakeups and wait-time metrics.
+
+    With the affinity policy a pending task that uses the currently loaded models may overtake
+    the head of the queue, so refresh_everything() does not reload checkpoints and LoRAs between
+    interleaved jobs. No task is overtaken more than fairness_window times.
+    """
+
+    def __init__(self, policy=scheduler_fifo, fairness_window=4):
+        assert policy in scheduler_policies, f'Unknown task scheduler policy: {policy}'
+        self._tasks = deque()
+        self._condition = threading.Condition()
+        self.policy = policy
+        self.fairness_window = fairness_window
+        self.last_signature = None
+        self.model_reloads = 0
+        self.reloads_saved = 0
+        self.total_enqueued = 0
+        self.total_started = 0
+        self.total_cancelled = 0
+        self.total_wait_time = 0.0
+        self.max_wait_time = 0.0
+        self.last_wait_time = 0.0
+
+    def put(self, task):
+        with self._condition:
+            task.state = TaskState.QUEUED
+            task.enqueue_time = time.perf_counter()
+            self._tasks.append(task)
+            self.total_enqueued += 1
+            self._condition.notify()
+
+    # alias so the queue can stand in for the plain list it replaced
+    append = put
+
+    def get(self, timeout=None):
+        with self._condition:
+            if not self._condition.wait_for(lambda: len(self._tasks) > 0, timeout=timeout):
+                return None
+            task = self._select()
+            self._tasks.remove(task)
+            self._mark_started(task)
+            return task
+
+    def cancel(self, task):
+        with self._condition:
+            try:
+                self._tasks.remove(task)
+            except ValueError:
+                return False
+            task.state = TaskState.CANCELLED
+            self.total_cancelled += 1
+            return True
+
+    def pending(self):
+        with self._condition:
+            return list(self._tasks)
+
+    def _select(self):
+        head = self._tasks[0]
+        if self.policy != scheduler_affinity or self.last_signature is None:
+            return head
+        if model_signature(head) == self.last_signature:
+            return head
+
+        skipped = []
+        for task in self._tasks:
+            if model_signature(task) == self.last_signature:
+                for t in skipped:
+                    t.scheduler_bypass_count = getattr(t, 'scheduler_bypass_count', 0) + 1
+                self.reloads_saved += 1
+                return task
+            if getattr(task, 'scheduler_bypass_count', 0) >= self.fairness_window:
+                break
+            skipped.append(task)
+        return head
+
+    def _mark_started(self, task):
+        signature = model_signature(task)
+        if self.last_signature is not None and signature != self.last_signature:
+            self.model_reloads += 1
+        self.last_signature = signature
+
+        wait_time = time.perf_counter() - getattr(task, 'enqueue_time', time.perf_counter())
+        task.state = TaskState.RUNNING
+        task.wait_time = wait_time
+        self.total_started += 1
+        self.total_wait_time += wait_time
+        self.max_wait_time = max(self.max_wait_time, wait_time)
+        self.last_wait_time = wait_time
+
+    def metrics(self):
+        with self._condition:
+            return dict(
+                depth=len(self._tasks),
+                enqueued=self.total_enqueued,
+                started=self.total_started,
+                cancelled=self.total_cancelled,
+                policy=self.policy,
+                model_reloads=self.model_reloads,
+                reloads_saved=self.reloads_saved,
+                last_wait_time=self.last_wait_time,
+                max_wait_time=self.max_wait_time,
+                average_wait_time=self.total_wait_time / self.total_started if self.total_started > 0 else 0.0
+            )
+
+    def __len__(self):
+        return len(self._tasks)
@@ -1,19 +1,24 @@
 from collections import OrderedDict
 
-import modules.core as core
+import numpy as np
 import torch
-from ldm_patched.contrib.external_upscale_model import ImageUpscaleWithModel
+
+import args_manager
+import ldm_patched.modules.model_management as model_management
+import ldm_patched.modules.utils
+from ldm_patched.modules.model_patcher import ModelPatcher
 from ldm_patched.pfn.architecture.RRDB import RRDBNet as ESRGAN
 from modules.config import downloading_upscale_model
 
-opImageUpscaleWithModel = ImageUpscaleWithModel()
 model = None
 
+upscale_tile_size = 512
+upscale_tile_overlap = 32
+upscale_tile_batch_size = 4
 
-def perform_upscale(img):
-    global model
 
-    print(f'Upscaling image with shape {str(img.shape)} ...')
+def load_upscale_model():
+    global model
 
     if model is None:
         model_filename = downloading_upscale_model()
@@ -22,12 +27,112 @@ def perform_upscale(img):
         for k, v in sd.items():
             sdo[k.replace('residual_block_', 'RDB')] = v
         del sd
-        model = ESRGAN(sdo)
-        model.cpu()
-        model.eval()
+        esrgan = ESRGAN(sdo)
+        esrgan.eval()
+
+        load_device = model_management.get_torch_device()
+        if args_manager.args.upscale_fp16 and model_management.should_use_fp16(load_device):
+            esrgan.half()
+
+        offload_device = model_management.unet_offload_device()
+        esrgan.to(offload_device)
+        model = ModelPatcher(esrgan, load_device=load_device, offload_device=offload_device)
+
+    return model
+
+
+def upscale_memory_required(xs, scale):
+    # the tiles are blended on the compute device: the 3 channel sum, the 1 channel weight and the
+    # 3 channel quotient of every float32 output live there until it is moved to the CPU
+    output_pixels = sum(x.shape[0] * x.shape[2] * x.shape[3] for x in xs) * scale * scale
+    tile_pixels = upscale_tile_batch_size * upscale_tile_size * upscale_tile_size * scale * scale
+    return (output_pixels * 7 + tile_pixels * 3) * 4
+
+
+@torch.inference_mode()
+def tiled_scale_images(xs, function, tile, overlap, scale, tile_batch_size, output_device='cpu'):
+    """Like ldm_patched.modules.utils.tiled_scale for a list of 1CHW images of any size.
+
+    Tiles of equal shape are batched across all images. An image is moved to output_device as soon as
+    its last tile is blended.
+    """
+    feather = round(overlap * scale)
+    tiles = {}
+    remaining = []
+    for index, image in enumerate(xs):
+        positions = [(index, y, x) for y in range(0, image.shape[2], tile - overlap)
+                     for x in range(0, image.shape[3], tile - overlap)]
+        for _, y, x in positions:
+            shape = (min(tile, image.shape[2] - y), min(tile, image.shape[3] - x))
+            tiles.setdefault(shape, []).append((index, y, x))
+        remaining.append(len(positions))
+
+    results = [None] * len(xs)
+    out, out_div = {}, {}
+    for positions in tiles.values():
+        for i in range(0, len(positions), max(tile_batch_size, 1)):
+            chunk = positions[i:i + max(tile_batch_size, 1)]
+            ps = function(torch.cat([xs[index][:, :, y:y + tile, x:x + tile] for index, y, x in chunk])).float()
+            mask = ldm_patched.modules.utils.feather_mask(ps.shape[2], ps.shape[3], feather, ps.device)
+            for (index, y, x), p in zip(chunk, ps):
+                if index not in out:
+                    height, width = round(xs[index].shape[2] * scale), round(xs[index].shape[3] * scale)
+                    out[index] = torch.zeros((1, p.shape[0], height, width), device=ps.device)
+                    out_div[index] = torch.zeros((1, 1, height, width), device=ps.device)
+                oy, ox = round(y * scale), round(x * scale)
+                h, w = min(p.shape[1], out[index].shape[2] - oy), min(p.shape[2], out[index].shape[3] - ox)
+                out[index][:, :, oy:oy + h, ox:ox + w] += p[None, :, :h, :w] * mask[:, :, :h, :w]
+                out_div[index][:, :, oy:oy + h, ox:ox + w] += mask[:, :, :h, :w]
+                remaining[index] -= 1
+                if remaining[index] == 0:
+                    results[index] = (out.pop(index) / out_div.pop(index)).to(output_device)
+    return results
+
+
+@torch.no_grad()
+@torch.inference_mode()
+def upscale_tensor(patcher, x):
+    """Upscales a 1CHW tensor, or a list of them, and returns the result on the CPU."""
+    single = not isinstance(x, list)
+    xs = [x] if single else x
+
+    esrgan = patcher.model
+    dtype = next(esrgan.parameters()).dtype
+    function = lambda a: esrgan(a.to(dtype))
+
+    tile, batch_size = upscale_tile_size, upscale_tile_batch_size
+    while True:
+        try:
+            ys = tiled_scale_images(xs, function, tile, upscale_tile_overlap, esrgan.scale, batch_size)
+            return ys[0] if single else ys
+        except model_management.OOM_EXCEPTION as e:
+            # give up batching before shrinking the tiles
+            if batch_size > 1:
+                batch_size //= 2
+            elif tile > 128:
+                tile //= 2
+            else:
+                raise e
+            model_management.soft_empty_cache(force=True)
+            print(f'[Upscaler] Out of memory, retrying with tile {tile} and tile batch size {batch_size}.')
+
+
+def perform_upscale(img):
+    """Upscales one HWC uint8 image, or a list of them in one pass over the model."""
+    single = not isinstance(img, list)
+    images = [img] if single else img
+
+    for image in images:
+        print(f'Upscaling image with shape {str(image.shape)} ...')
+
+    patcher = load_upscale_model()
+
+    # uint8 is copied to the device, the float conversion happens there
+    xs = [torch.from_numpy(np.ascontiguousarray(image)).to(patcher.load_device).movedim(-1, 0)[None].float() / 255.0
+          for image in images]
 
-    img = core.numpy_to_pytorch(img)
-    img = opImageUpscaleWithModel.upscale(model, img)[0]
-    img = core.pytorch_to_numpy(img)[0]
+    # reserve room for the full size blending buffers, not only for the weights
+    model_management.load_models_gpu([patcher], memory_required=upscale_memory_required(xs, patcher.model.scale))
 
-    return img
+    results = [(y[0].movedim(0, -1).clamp(0, 1) * 255.0).to(torch.uint8).numpy() for y in upscale_tensor(patcher, xs)]
+    return results[0] if single else results
@@ -11,6 +11,7 @@ from typing import List, Tuple, AnyStr, NamedTuple
 
 import json
 import hashlib
+import mmap
 
 from PIL import Image
 
@@ -202,13 +203,23 @@ def addnet_hash_safetensors(b):
     return hash_sha256.hexdigest()
 
 
-def calculate_sha256(filename) -> str:
+def calculate_sha256(filename, use_mmap=True, blksize=16 * 1024 * 1024) -> str:
     hash_sha256 = hashlib.sha256()
-    blksize = 1024 * 1024
 
     with open(filename, "rb") as f:
-        for chunk in iter(lambda: f.read(blksize), b""):
-            hash_sha256.update(chunk)
+        size = os.fstat(f.fileno()).st_size
+        if use_mmap and size > 0:
+            # hashlib releases the GIL for large updates, so several files can be hashed in parallel threads
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                view = memoryview(mm)
+                try:
+                    for offset in range(0, size, blksize):
+                        hash_sha256.update(view[offset:offset + blksize])
+                finally:
+                    view.release()
+        else:
+            for chunk in iter(lambda: f.read(blksize), b""):
+                hash_sha256.update(chunk)
 
     return hash_sha256.hexdigest()
 
@@ -465,31 +476,95 @@ def cleanup_prompt(prompt):
     return cleaned_prompt[:-2]
 
 
-def apply_wildcards(wildcard_text, rng, i, read_wildcards_in_order) -> str:
-    for _ in range(modules.config.wildcards_max_bfs_depth):
-        placeholders = re.findall(r'__([\w-]+)__', wildcard_text)
-        if len(placeholders) == 0:
-            return wildcard_text
-
-        print(f'[Wildcards] processing: {wildcard_text}')
-        for placeholder in placeholders:
-            try:
-                matches = [x for x in modules.config.wildcard_filenames if os.path.splitext(os.path.basename(x))[0] == placeholder]
-                words = open(os.path.join(modules.config.path_wildcards, matches[0]), encoding='utf-8').read().splitlines()
-                words = [x for x in words if x != '']
-                assert len(words) > 0
-                if read_wildcards_in_order:
-                    wildcard_text = wildcard_text.replace(f'__{placeholder}__', words[i % len(words)], 1)
-                else:
-                    wildcard_text = wildcard_text.replace(f'__{placeholder}__', rng.choice(words), 1)
-            except:
+wildcard_placeholder_regex = re.compile(r'__([\w-]+)__')
+
+
+class WildcardIndex:
+    """Wildcard name -> word list, read once and re-read only when the file's mtime changes."""
+
+    def __init__(self):
+        self.filenames = None
+        self.paths = {}
+        self.entries = {}
+
+    def refresh_filenames(self):
+        # config.update_files() assigns a new list, rebuild the name lookup when that happens
+        if self.filenames is modules.config.wildcard_filenames:
+            return
+        self.filenames = modules.config.wildcard_filenames
+        self.paths = {}
+        for filename in self.filenames:
+            self.paths.setdefault(os.path.splitext(os.path.basename(filename))[0],
+                                  os.path.join(modules.config.path_wildcards, filename))
+
+    def words(self, name, checked=None):
+        """Returns the non-empty lines of the wildcard file, or None if it is missing, unreadable or empty.
+
+        Names in checked were already validated against their mtime during this expansion.
+        """
+        self.refresh_filenames()
+        path = self.paths.get(name)
+        if path is None:
+            return None
+
+        entry = self.entries.get(name)
+        if checked is not None and name in checked and entry is not None:
+            return entry[1]
+
+        try:
+            mtime = os.stat(path).st_mtime_ns
+            if entry is None or entry[0] != mtime:
+                with open(path, encoding='utf-8') as f:
+                    words = [x for x in f.read().splitlines() if x != '']
+                entry = self.entries[name] = (mtime, words if len(words) > 0 else None)
+        except (OSError, UnicodeDecodeError) as e:
+            print(f'[Wildcards] Cannot read {path}: {e}')
+            return None
+        if checked is not None:
+            checked.add(name)
+        return entry[1]
+
+    def expand(self, wildcard_text, rng, i, read_wildcards_in_order, checked=None):
+        original_text = wildcard_text
+        checked = set() if checked is None else checked
+
+        def replace(match):
+            placeholder = match.group(1)
+            words = self.words(placeholder, checked)
+            if words is None:
                 print(f'[Wildcards] Warning: {placeholder}.txt missing or empty. '
                       f'Using "{placeholder}" as a normal word.')
-                wildcard_text = wildcard_text.replace(f'__{placeholder}__', placeholder)
-            print(f'[Wildcards] {wildcard_text}')
+                return placeholder
+            if read_wildcards_in_order:
+                return words[i % len(words)]
+            return rng.choice(words)
+
+        # one pass per nesting level, placeholders are replaced left to right
+        for _ in range(modules.config.wildcards_max_bfs_depth):
+            wildcard_text, count = wildcard_placeholder_regex.subn(replace, wildcard_text)
+            if count == 0:
+                if wildcard_text != original_text:
+                    print(f'[Wildcards] {original_text} -> {wildcard_text}')
+                return wildcard_text
+
+        print(f'[Wildcards] BFS stack overflow. Current text: {wildcard_text}')
+        return wildcard_text
+
+
+wildcard_index = WildcardIndex()
+
 
-    print(f'[Wildcards] BFS stack overflow. Current text: {wildcard_text}')
-    return wildcard_text
+def apply_wildcards(wildcard_text, rng, i, read_wildcards_in_order) -> str:
+    return wildcard_index.expand(wildcard_text, rng, i, read_wildcards_in_order)
+
+
+def apply_wildcards_bulk(wildcard_texts, rng, i, read_wildcards_in_order, checked=None) -> list:
+    """Expands several prompts in order with one rng, checking each wildcard file only once.
+
+    Pass the same checked set to several calls to skip the mtime check of files already seen by an earlier one.
+    """
+    checked = set() if checked is None else checked
+    return [wildcard_index.expand(text, rng, i, read_wildcards_in_order, checked) for text in wildcard_texts]
 
 
 def get_image_size_info(image: np.ndarray, aspect_ratios: list) -> str:
@@ -0,0 +1,300 @@
+import importlib
+import os
+import secrets
+import subprocess
+import sys
+import threading
+import traceback
+from multiprocessing.connection import Listener, Client
+
+from modules.task_queue import TaskState, model_signature
+
+POOL_ADDRESS_ENV = 'FOOOCUS_WORKER_POOL_ADDRESS'
+POOL_AUTHKEY_ENV = 'FOOOCUS_WORKER_POOL_AUTHKEY'
+POOL_INDEX_ENV = 'FOOOCUS_WORKER_POOL_INDEX'
+POOL_TARGET_ENV = 'FOOOCUS_WORKER_POOL_TARGET'
+
+default_serve_target = 'modules.worker_pool:serve_async_worker'
+
+
+def is_pool_worker():
+    return POOL_ADDRESS_ENV in os.environ
+
+
+def parse_devices(devices, size):
+    """Expands '--worker-pool-devices 0,1' (or 'cpu') to one device entry per worker."""
+    if devices is None or str(devices).strip() == '':
+        return [None] * size
+    devices = [d.strip() for d in str(devices).split(',') if d.strip() != '']
+    return [devices[i % len(devices)] for i in range(size)]
+
+
+class PoolWorker:
+    def __init__(self, index, device):
+        self.index = index
+        self.device = device
+        self.process = None
+        self.conn = None
+        self.send_lock = threading.Lock()
+        self.tasks = {}
+        self.loaded_signature = None
+        self.alive = True
+
+    @property
+    def load(self):
+        return len(self.tasks)
+
+    def send(self, message):
+        with self.send_lock:
+            self.conn.send(message)
+
+
+class WorkerPool:
+    """Runs AsyncTasks in N worker processes, each with its own device and pipeline globals.
+
+    Tasks are pulled from the shared TaskQueue and routed to the least-loaded worker,
+    preferring one whose last task used the same models so refresh_everything() is a no-op.
+    """
+
+    def __init__(self, task_queue, size, devices=None, argv=None, serve_target=default_serve_target,
+                 max_tasks_per_worker=1):
+        self.task_queue = task_queue
+        self.size = size
+        self.devices = parse_devices(devices, size)
+        self.argv = list(sys.argv[1:] if argv is None else argv)
+        self.serve_target = serve_target
+        self.max_tasks_per_worker = max_tasks_per_worker
+        self.workers = [PoolWorker(i, d) for i, d in enumerate(self.devices)]
+        self.condition = threading.Condition()
+        self.next_task_id = 0
+        self.affinity_hits = 0
+        self.listener = None
+
+    def start(self):
+        authkey = secrets.token_bytes(16)
+        self.listener = Listener(('127.0.0.1', 0), authkey=authkey)
+        host, port = self.listener.address
+        root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+        for worker in self.workers:
+            env = os.environ.copy()
+            env[POOL_ADDRESS_ENV] = f'{host}:{port}'
+            env[POOL_AUTHKEY_ENV] = authkey.hex()
+            env[POOL_INDEX_ENV] = str(worker.index)
+            env[POOL_TARGET_ENV] = self.serve_target
+            argv = list(self.argv)
+            if worker.device is not None:
+                if worker.device == 'cpu':
+                    if '--always-cpu' not in argv:
+                        argv.append('--always-cpu')
+                else:
+                    env['CUDA_VISIBLE_DEVICES'] = str(worker.device)
+            worker.process = subprocess.Popen(
+                [sys.executable, '-c', 'from modules.worker_pool import serve; serve()'] + argv,
+                cwd=root, env=env)
+            print(f'[Worker Pool] Started worker {worker.index} (PID {worker.process.pid}, '
+                  f'device {worker.device if worker.device is not None else "default"})')
+
+        threading.Thread(target=self.accept_loop, daemon=True).start()
+        threading.Thread(target=self.dispatch_loop, daemon=True).start()
+
+    def accept_loop(self):
+        for _ in range(self.size):
+            conn = self.listener.accept()
+            kind, index = conn.recv()
+            assert kind == 'hello'
+            worker = self.workers[index]
+            worker.conn = conn
+            threading.Thread(target=self.receive_loop, args=(worker,), daemon=True).start()
+            with self.condition:
+                self.condition.notify_all()
+
+    def wait_ready(self, timeout=None):
+        with self.condition:
+            return self.condition.wait_for(lambda: all(w.conn is not None for w in self.workers if w.alive),
+                                           timeout=timeout)
+
+    def available_workers(self):
+        return [w for w in self.workers
+                if w.alive and w.conn is not None and w.load < self.max_tasks_per_worker]
+
+    def select_worker(self, task, candidates):
+        signature = model_signature(task)
+        matching = [w for w in candidates if w.loaded_signature == signature]
+        if len(matching) > 0:
+            self.affinity_hits += 1
+            candidates = matching
+        return min(candidates, key=lambda w: (w.load, w.index))
+
+    def dispatch_loop(self):
+        while True:
+            with self.condition:
+                self.condition.wait_for(lambda: len(self.available_workers()) > 0
+                                        or not any(w.alive for w in self.workers))
+
+            task = self.task_queue.get()
+
+            if not any(w.alive for w in self.workers):
+                print('[Worker Pool] No worker process alive, dropping task.')
+                task.state = TaskState.DONE
+                task.yields.append(['finish', task.results])
+                continue
+
+            with self.condition:
+                candidates = self.available_workers()
+                if len(candidates) == 0:
+                    # the only free worker died while we were waiting for a task
+                    self.task_queue.put(task)
+                    continue
+                worker = self.select_worker(task, candidates)
+                task_id = self.next_task_id
+                self.next_task_id += 1
+                task.pool_task_id = task_id
+                task.pool_worker = worker
+                worker.tasks[task_id] = task
+                worker.loaded_signature = model_signature(task)
+
+            try:
+                worker.send(('task', task_id, task.args))
+            except (OSError, EOFError):
+                traceback.print_exc()
+                self.worker_died(worker)
+
+    def receive_loop(self, worker):
+        while True:
+            try:
+                message = worker.conn.recv()
+            except (OSError, EOFError):
+                self.worker_died(worker)
+                return
+
+            kind, task_id = message[0], message[1]
+            task = worker.tasks.get(task_id)
+            if task is None:
+                continue
+
+            if kind == 'started':
+                task.processing = True
+                task.state = TaskState.RUNNING
+            elif kind == 'yield':
+                flag, product = message[2]
+                if flag == 'finish':
+                    state = message[3]
+                    task.results = product
+                    task.images_to_enhance_count = state['images_to_enhance_count']
+                    task.enhance_stats = state['enhance_stats']
+                    task.should_enhance = state['should_enhance']
+                    task.processing = False
+                    task.state = TaskState.DONE
+                    with self.condition:
+                        del worker.tasks[task_id]
+                        self.condition.notify_all()
+                task.yields.append([flag, product])
+
+    def worker_died(self, worker):
+        with self.condition:
+            if not worker.alive:
+                return
+            worker.alive = False
+            orphans = list(worker.tasks.values())
+            worker.tasks.clear()
+            self.condition.notify_all()
+        print(f'[Worker Pool] Worker {worker.index} exited, {len(orphans)} task(s) aborted.')
+        for task in orphans:
+            task.processing = False
+            task.state = TaskState.DONE
+            task.yields.append(['finish', task.results])
+
+    def interrupt(self, task, stop):
+        worker = getattr(task, 'pool_worker', None)
+        if worker is None or not worker.alive:
+            return False
+        try:
+            worker.send((stop, task.pool_task_id))
+        except (OSError, EOFError):
+            return False
+        return True
+
+    def metrics(self):
+        with self.condition:
+            return dict(
+                workers=[dict(index=w.index, device=w.device, alive=w.alive, load=w.load) for w in self.workers],
+                affinity_hits=self.affinity_hits,
+                dispatched=self.next_task_id
+            )
+
+    def shutdown(self):
+        for worker in self.workers:
+            if worker.conn is not None and worker.alive:
+                try:
+                    worker.send(('shutdown', None))
+                except (OSError, EOFError):
+                    pass
+        for worker in self.workers:
+            if worker.process is not None:
+                try:
+                    worker.process.wait(timeout=10)
+                except subprocess.TimeoutExpired:
+                    worker.process.kill()
+
+
+def serve():
+    host, port = os.environ[POOL_ADDRESS_ENV].rsplit(':', 1)
+    conn = Client((host, int(port)), authkey=bytes.fromhex(os.environ[POOL_AUTHKEY_ENV]))
+    conn.send(('hello', int(os.environ[POOL_INDEX_ENV])))
+
+    module_name, function_name = os.environ.get(POOL_TARGET_ENV, default_serve_target).split(':')
+    getattr(importlib.import_module(module_name), function_name)(conn)
+
+
+def serve_async_worker(conn):
+    # importing async_worker starts the regular single-threaded worker in this process
+    import modules.async_worker as worker
+    import ldm_patched.modules.model_management as model_management
+
+    send_lock = threading.Lock()
+    tasks = {}
+
+    def send(message):
+        with send_lock:
+            conn.send(message)
+
+    def forward_yields(task_id, task):
+        # the first item is produced by handler(), i.e. once the task left the local queue
+        flag, product = task.yields.pop()
+        send(('started', task_id))
+        while flag != 'finish':
+            send(('yield', task_id, (flag, product)))
+            flag, product = task.yields.pop()
+
+        state = dict(images_to_enhance_count=task.images_to_enhance_count,
+                     enhance_stats=task.enhance_stats,
+                     should_enhance=task.should_enhance)
+        send(('yield', task_id, (flag, product), state))
+        tasks.pop(task_id, None)
+
+    while True:
+        try:
+            message = conn.recv()
+        except (OSError, EOFError):
+            return
+
+        kind, task_id = message[0], message[1]
+        if kind == 'shutdown':
+            return
+        if kind == 'task':
+            with model_management.interrupt_processing_mutex:
+                model_management.interrupt_processing = False
+            task = worker.AsyncTask(args=message[2])
+            tasks[task_id] = task
+            threading.Thread(target=forward_yields, args=(task_id, task), daemon=True).start()
+            worker.async_tasks.put(task)
+        elif kind in ['stop', 'skip']:
+            task = tasks.get(task_id)
+            if task is None:
+                continue
+            task.last_stop = kind
+            if task.processing:
+                model_management.interrupt_current_processing()
+            elif kind == 'stop' and worker.async_tasks.cancel(task):
+                task.yields.append(['finish', task.results])
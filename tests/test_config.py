@@ -0,0 +1,38 @@
+import threading
+import unittest
+from unittest import mock
+
+import modules.config
+
+
+class TestRefreshFiles(unittest.TestCase):
+    def setUp(self):
+        for name, value in [('file_watcher', None), ('files_rescan', None)]:
+            patcher = mock.patch.object(modules.config, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def test_slow_rescan_does_not_block(self):
+        release = threading.Event()
+        calls = []
+
+        def update_files():
+            calls.append(threading.current_thread())
+            release.wait(5)
+
+        with mock.patch.object(modules.config, 'update_files', update_files):
+            modules.config.refresh_files(timeout=0.05)
+            # a second click joins the running scan
+            modules.config.refresh_files(timeout=0.05)
+            self.assertEqual(len(calls), 1)
+            self.assertIsNot(calls[0], threading.current_thread())
+
+            release.set()
+            modules.config.files_rescan.join(5)
+            modules.config.refresh_files(timeout=5)
+            self.assertEqual(len(calls), 2)
+            self.assertFalse(modules.config.files_rescan.is_alive())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,25 @@
+import unittest
+
+import torch
+
+import modules.core as core
+
+
+class TestPrepareNoise(unittest.TestCase):
+    def test_seed_list_matches_single_seeds(self):
+        latent = torch.zeros(3, 4, 8, 8)
+        seeds = [12345, 0, 2 ** 32 + 7]
+
+        noise = core.prepare_noise(latent, seeds)
+
+        self.assertEqual(noise.shape, latent.shape)
+        for i, seed in enumerate(seeds):
+            self.assertTrue(torch.equal(noise[i:i + 1], core.prepare_noise(latent[i:i + 1], seed)))
+
+    def test_one_seed_per_sample(self):
+        with self.assertRaises(AssertionError):
+            core.prepare_noise(torch.zeros(2, 4, 8, 8), [1])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,88 @@
+import unittest
+from unittest import mock
+
+import torch
+
+pipeline = None
+
+
+def stub_encode(text):
+    generator = torch.Generator().manual_seed(sum(map(ord, text)))
+    return torch.randn(1, 77, 8, generator=generator), torch.randn(1, 8, generator=generator)
+
+
+class StubCondStageModel:
+    def __init__(self):
+        self.batches = []
+
+    def clip_layer(self, layer_idx):
+        pass
+
+    def reset_clip_layer(self):
+        pass
+
+    def encode_token_weights_batch(self, token_weight_pairs):
+        self.batches.append(token_weight_pairs)
+        return [stub_encode(tokens) for tokens in token_weight_pairs]
+
+
+class StubClip:
+    def __init__(self):
+        self.layer_idx = None
+        self.fcs_cond_cache = {}
+        self.cond_stage_model = StubCondStageModel()
+
+    def tokenize(self, text):
+        return text
+
+    def encode_from_tokens(self, tokens, return_pooled=False):
+        return stub_encode(tokens)
+
+    def load_model(self):
+        pass
+
+
+class TestClipEncodeBatch(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        # importing the pipeline loads the default checkpoint
+        global pipeline
+        try:
+            import modules.default_pipeline as pipeline
+        except Exception as e:
+            raise unittest.SkipTest(f'default pipeline unavailable: {e}')
+
+    def encode(self, fn, *args):
+        clip = StubClip()
+        with mock.patch.object(pipeline, 'final_clip', clip):
+            return fn(*args), clip
+
+    def assertCondEqual(self, first, second):
+        self.assertEqual(first is None, second is None)
+        if first is None:
+            return
+        (cond, extra), = first
+        (expected_cond, expected_extra), = second
+        self.assertTrue(torch.equal(cond, expected_cond))
+        self.assertTrue(torch.equal(extra['pooled_output'], expected_extra['pooled_output']))
+
+    def test_matches_per_text_encoding(self):
+        text_lists = [['a cat', 'sharp'], ['a dog', 'a cat', 'sharp', 'detailed'], ['blurry'], [], None]
+        pool_top_ks = [2, 1, 1, 1, 1]
+
+        batched, clip = self.encode(pipeline.clip_encode_batch, text_lists, pool_top_ks)
+        self.assertEqual(sum(len(batch) for batch in clip.cond_stage_model.batches), 5)
+
+        for texts, pool_top_k, result in zip(text_lists, pool_top_ks, batched):
+            expected, _ = self.encode(pipeline.clip_encode, texts, pool_top_k)
+            self.assertCondEqual(result, expected)
+
+    def test_string_entry_is_one_text(self):
+        batched, _ = self.encode(pipeline.clip_encode_batch, ['a cat', ['a cat']], [1, 1])
+        expected, _ = self.encode(pipeline.clip_encode, ['a cat'], 1)
+        self.assertCondEqual(batched[0], expected)
+        self.assertCondEqual(batched[1], expected)
+
+
+if __name__ == '__main__':
+    unittest.main()
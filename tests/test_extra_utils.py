@@ -1,5 +1,6 @@
 import numbers
 import os
+import tempfile
 import unittest
 
 import modules.flags
@@ -72,3 +73,24 @@ class TestUtils(unittest.TestCase):
             expected = test["output"]
             actual = extra_utils.try_eval_env_var(value, expected_type)
             self.assertEqual(expected, actual)
+
+    def test_get_files_from_folder(self):
+        with tempfile.TemporaryDirectory() as folder:
+            for path in ['b.safetensors', 'A.ckpt', 'notes.txt', os.path.join('sub', 'x.bin'),
+                         os.path.join('sub', 'deep', 'y.pth')]:
+                os.makedirs(os.path.dirname(os.path.join(folder, path)), exist_ok=True)
+                open(os.path.join(folder, path), 'w').close()
+
+            # listings are only cached once a directory is older than the settle time
+            old = 1_000_000_000
+            for root, _, _ in os.walk(folder):
+                os.utime(root, ns=(old, old))
+
+            extensions = ['.ckpt', '.bin', '.pth', '.safetensors']
+            expected = [os.path.join('sub', 'deep', 'y.pth'), os.path.join('sub', 'x.bin'), 'A.ckpt', 'b.safetensors']
+            self.assertEqual(expected, extra_utils.get_files_from_folder(folder, extensions))
+            self.assertEqual(['b.safetensors'], extra_utils.get_files_from_folder(folder, extensions, 'b'))
+            self.assertIn(os.path.join(folder, 'sub'), extra_utils.directory_snapshot.entries)
+
+            open(os.path.join(folder, 'sub', 'z.bin'), 'w').close()
+            self.assertIn(os.path.join('sub', 'z.bin'), extra_utils.get_files_from_folder(folder, extensions))
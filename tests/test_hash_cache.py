@@ -0,0 +1,87 @@
+import json
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+from modules import hash_cache
+from modules.util import sha256
+
+
+class TestHashCache(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.temp_dir.cleanup)
+        self.model_path = os.path.join(self.temp_dir.name, 'model.safetensors')
+        self.write_model(b'first')
+
+        for name, value in [('hash_cache_filename', os.path.join(self.temp_dir.name, 'hash_cache.db')),
+                            ('legacy_hash_cache_filename', os.path.join(self.temp_dir.name, 'hash_cache.txt')),
+                            ('hash_cache', {}), ('hashing_in_progress', {}), ('connection', None)]:
+            patcher = mock.patch.object(hash_cache, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.addCleanup(self.close_connection)
+
+        self.sha256 = mock.Mock(side_effect=sha256)
+        patcher = mock.patch.object(hash_cache, 'sha256', self.sha256)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def close_connection(self):
+        if hash_cache.connection is not None:
+            hash_cache.connection.close()
+
+    def write_model(self, content, mtime_ns=None):
+        with open(self.model_path, 'wb') as fp:
+            fp.write(content)
+        if mtime_ns is not None:
+            os.utime(self.model_path, ns=(mtime_ns, mtime_ns))
+
+    def reload(self):
+        self.close_connection()
+        hash_cache.connection = None
+        hash_cache.hash_cache = {}
+        hash_cache.load_cache_from_file()
+
+    def test_hit_when_file_unchanged(self):
+        first = hash_cache.sha256_from_cache(self.model_path)
+        self.assertEqual(hash_cache.sha256_from_cache(self.model_path), first)
+
+        # the index on disk is used by a fresh process as well
+        self.reload()
+        self.assertEqual(hash_cache.sha256_from_cache(self.model_path), first)
+        self.assertEqual(self.sha256.call_count, 1)
+
+    def test_rehash_after_modification(self):
+        self.write_model(b'first', mtime_ns=1_000_000_000)
+        first = hash_cache.sha256_from_cache(self.model_path)
+
+        self.write_model(b'second', mtime_ns=2_000_000_000)
+        second = hash_cache.sha256_from_cache(self.model_path)
+
+        self.assertEqual(self.sha256.call_count, 2)
+        self.assertNotEqual(first, second)
+        self.assertEqual(second, sha256(self.model_path))
+
+        self.reload()
+        self.assertEqual(hash_cache.sha256_from_cache(self.model_path), second)
+        self.assertEqual(self.sha256.call_count, 2)
+
+    def test_migrate_legacy_cache(self):
+        missing_path = os.path.join(self.temp_dir.name, 'deleted.safetensors')
+        with open(hash_cache.legacy_hash_cache_filename, 'wt', encoding='utf-8') as fp:
+            fp.write(json.dumps({self.model_path: 'a' * 10}) + '\n')
+            fp.write(json.dumps({missing_path: 'b' * 10}) + '\n')
+            fp.write(json.dumps({self.model_path + '.bak': 'short'}) + '\n')
+
+        hash_cache.load_cache_from_file()
+
+        self.assertTrue(os.path.exists(hash_cache.hash_cache_filename))
+        self.assertEqual(list(hash_cache.hash_cache), [self.model_path])
+        self.assertEqual(hash_cache.sha256_from_cache(self.model_path), 'a' * 10)
+        self.sha256.assert_not_called()
+
+
+if __name__ == '__main__':
+    unittest.main()
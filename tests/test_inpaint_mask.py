@@ -0,0 +1,85 @@
+import unittest
+from unittest import mock
+
+import numpy as np
+import torch
+
+from extras import inpaint_mask
+from modules.model_cache import LRUCache
+
+
+class FakeSamPredictor:
+    def __init__(self, model):
+        self.model = model
+        self.offload_device = torch.device('cpu')
+        self.encoded = 0
+        self.restored = 0
+        self.features = None
+
+    def set_image(self, image):
+        self.encoded += 1
+        self.features = torch.full((1, 4, 2, 2), float(image.mean()))
+        self.original_size = image.shape[:2]
+        self.input_size = (4, 4)
+
+    def set_image_embedding(self, features, original_size, input_size):
+        self.restored += 1
+        self.features = features
+        self.original_size = original_size
+        self.input_size = input_size
+
+    def get_image_embedding(self):
+        return self.features
+
+
+class TestSamCache(unittest.TestCase):
+    def setUp(self):
+        self.built = []
+        registry = {name: (lambda checkpoint: self.built.append(checkpoint) or checkpoint) for name in ['vit_b', 'vit_l']}
+        patches = [
+            mock.patch.object(inpaint_mask, 'sam_model_registry', registry),
+            mock.patch.object(inpaint_mask, 'SamPredictor', FakeSamPredictor),
+            mock.patch.object(inpaint_mask.modules.config, 'download_sam_model', lambda model_type: f'{model_type}.pth'),
+            mock.patch.object(inpaint_mask, 'sam_predictors', LRUCache(1, lambda predictor: 1)),
+            mock.patch.object(inpaint_mask, 'sam_embeddings', LRUCache(1024 ** 2, lambda entry: 1)),
+        ]
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+
+    def embed(self, model_type, image):
+        checkpoint, predictor = inpaint_mask.get_sam_predictor(model_type)
+        inpaint_mask.set_sam_image(predictor, checkpoint, image)
+        return predictor
+
+    def test_same_image_reuses_embedding(self):
+        image = np.full((8, 8, 3), 10, dtype=np.uint8)
+        first = self.embed('vit_b', image)
+        second = self.embed('vit_b', image.copy())
+
+        self.assertIs(first, second)
+        self.assertEqual(self.built, ['vit_b.pth'])
+        self.assertEqual((second.encoded, second.restored), (1, 1))
+        self.assertEqual(second.original_size, (8, 8))
+
+    def test_different_image_or_checkpoint_misses(self):
+        image = np.full((8, 8, 3), 10, dtype=np.uint8)
+        predictor = self.embed('vit_b', image)
+        self.embed('vit_b', np.full((8, 8, 3), 20, dtype=np.uint8))
+        self.assertEqual((predictor.encoded, predictor.restored), (2, 0))
+
+        other = self.embed('vit_l', image)
+        self.assertIsNot(other, predictor)
+        self.assertEqual((other.encoded, other.restored), (1, 0))
+        self.assertEqual(self.built, ['vit_b.pth', 'vit_l.pth'])
+
+    def test_model_cache_disabled(self):
+        with mock.patch.object(inpaint_mask, 'sam_predictors', LRUCache(0, lambda predictor: 1)):
+            image = np.full((8, 8, 3), 10, dtype=np.uint8)
+            first = self.embed('vit_b', image)
+            second = self.embed('vit_b', image)
+
+        self.assertIsNot(first, second)
+        self.assertEqual(self.built, ['vit_b.pth', 'vit_b.pth'])
+        # the embedding cache still spares the second encoder run
+        self.assertEqual((second.encoded, second.restored), (0, 1))
@@ -0,0 +1,34 @@
+import unittest
+
+from modules.model_cache import LRUCache
+
+
+class TestLRUCache(unittest.TestCase):
+    def test_evicts_least_recently_used_within_budget(self):
+        evicted = []
+        cache = LRUCache(10, len, on_evict=lambda key, value: evicted.append(key))
+        cache.put('a', 'xxxx')
+        cache.put('b', 'xxxx')
+        self.assertEqual(cache.get('a'), 'xxxx')
+
+        cache.put('c', 'xxxx')
+        self.assertEqual(evicted, ['b'])
+        self.assertIn('a', cache)
+        self.assertIn('c', cache)
+        self.assertEqual(cache.stats()['used_bytes'], 8)
+
+    def test_stats_and_oversized_values(self):
+        cache = LRUCache(4, len)
+        self.assertFalse(cache.put('big', 'xxxxx'))
+        self.assertIsNone(cache.get('big'))
+        cache.put('small', 'xx')
+        cache.get('small')
+
+        stats = cache.stats()
+        self.assertEqual((stats['hits'], stats['misses'], stats['evictions']), (1, 1, 0))
+
+    def test_disabled_cache_stores_nothing(self):
+        cache = LRUCache(0, len)
+        self.assertFalse(cache.enabled)
+        self.assertFalse(cache.put('a', 'x'))
+        self.assertEqual(len(cache), 0)
@@ -0,0 +1,52 @@
+import copy
+import unittest
+
+import torch
+
+from ldm_patched.modules.model_patcher import ModelPatcher
+
+
+class TestIncrementalWeightPatching(unittest.TestCase):
+    def setUp(self):
+        torch.manual_seed(0)
+        self.model = torch.nn.Sequential(torch.nn.Linear(4, 4), torch.nn.Linear(4, 4))
+        self.original = copy.deepcopy(self.model)
+        self.base = ModelPatcher(self.model, torch.device('cpu'), torch.device('cpu'))
+        self.base.incremental_patching = True
+
+        self.lora_a = {'0.weight': (torch.randn(4, 4),)}
+        self.lora_b = {'1.weight': (torch.randn(4, 4),)}
+        self.lora_b_changed = {'1.weight': (torch.randn(4, 4),)}
+
+    def patched(self, patcher, stack):
+        for patches, strength in stack:
+            patcher.add_patches(patches, strength)
+        patcher.patch_model()
+        return patcher
+
+    def full_patch(self, stack):
+        patcher = ModelPatcher(copy.deepcopy(self.original), torch.device('cpu'), torch.device('cpu'))
+        patcher.incremental_patching = False
+        return self.patched(patcher, stack).model.state_dict()
+
+    def assert_weights_equal(self, expected):
+        for key, value in self.model.state_dict().items():
+            self.assertTrue(torch.equal(value, expected[key]), key)
+
+    def test_only_changed_keys_are_patched(self):
+        first = self.patched(self.base.clone(), [(self.lora_a, 1.0), (self.lora_b, 0.5)])
+        self.assertEqual(sorted(first.last_patched_keys), ['0.weight', '1.weight'])
+        first.unpatch_model()
+
+        stack = [(self.lora_a, 1.0), (self.lora_b_changed, 0.5)]
+        second = self.patched(self.base.clone(), stack)
+        self.assertEqual(second.last_patched_keys, ['1.weight'])
+        self.assert_weights_equal(self.full_patch(stack))
+
+    def test_removed_lora_restores_weights(self):
+        self.patched(self.base.clone(), [(self.lora_a, 1.0), (self.lora_b, 0.5)]).unpatch_model()
+
+        stack = [(self.lora_a, 1.0)]
+        patcher = self.patched(self.base.clone(), stack)
+        self.assertEqual(patcher.last_patched_keys, [])
+        self.assert_weights_equal(self.full_patch(stack))
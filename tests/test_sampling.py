@@ -0,0 +1,26 @@
+import unittest
+
+import torch
+
+from ldm_patched.k_diffusion.sampling import BatchedBrownianTree
+
+
+class TestBatchedBrownianTree(unittest.TestCase):
+    def test_seed_list_matches_single_seeds(self):
+        x = torch.zeros(2, 4, 8, 8)
+        seeds = [12345, 678]
+        t0, t1 = torch.tensor(0.0625), torch.tensor(14.5)
+
+        batched = BatchedBrownianTree(x, t0, t1, seeds, cpu=True)
+        singles = [BatchedBrownianTree(x[i:i + 1], t0, t1, seed, cpu=True) for i, seed in enumerate(seeds)]
+
+        for s, s_next in [(14.5, 9.25), (9.25, 3.125), (3.125, 0.5), (0.5, 0.0625)]:
+            s, s_next = torch.tensor(s), torch.tensor(s_next)
+            w = batched(s, s_next)
+            self.assertEqual(w.shape, x.shape)
+            for i, tree in enumerate(singles):
+                self.assertTrue(torch.equal(w[i:i + 1], tree(s, s_next)))
+
+
+if __name__ == '__main__':
+    unittest.main()
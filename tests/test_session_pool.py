@@ -0,0 +1,39 @@
+import time
+import unittest
+
+from modules.session_pool import SessionPool
+
+
+class TestSessionPool(unittest.TestCase):
+    def test_reuses_sessions_per_key(self):
+        pool = SessionPool(idle_timeout=0)
+        created = []
+
+        def factory():
+            created.append(object())
+            return created[-1]
+
+        with pool.use(('model', False, 'cpu'), factory) as first:
+            pass
+        with pool.use(('model', False, 'cpu'), factory) as second:
+            pass
+        with pool.use(('model', True, 'cpu'), factory):
+            pass
+
+        self.assertIs(first, second)
+        self.assertEqual(len(created), 2)
+        self.assertEqual(pool.stats()['reused'], 1)
+
+    def test_evicts_idle_sessions_only(self):
+        pool = SessionPool(idle_timeout=60)
+        with pool.use('idle', object):
+            pass
+        with pool.use('busy', object):
+            evicted = pool.evict_idle(now=time.monotonic() + 120)
+
+        self.assertEqual(evicted, ['idle'])
+        self.assertEqual(pool.stats()['sessions'], 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
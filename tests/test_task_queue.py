@@ -0,0 +1,135 @@
+import threading
+import time
+import unittest
+
+from modules.task_queue import TaskQueue, TaskState, YieldChannel
+
+
+class DummyTask:
+    pass
+
+
+class TestTaskQueue(unittest.TestCase):
+    def test_get_blocks_until_put(self):
+        queue = TaskQueue()
+        task = DummyTask()
+        received = []
+
+        consumer = threading.Thread(target=lambda: received.append(queue.get()))
+        consumer.start()
+        time.sleep(0.05)
+        self.assertEqual(received, [])
+
+        queue.put(task)
+        consumer.join(timeout=1)
+        self.assertEqual(received, [task])
+        self.assertEqual(task.state, TaskState.RUNNING)
+
+    def test_fifo_and_metrics(self):
+        queue = TaskQueue()
+        tasks = [DummyTask() for _ in range(3)]
+        for task in tasks:
+            queue.put(task)
+
+        self.assertEqual(queue.metrics()['depth'], 3)
+        self.assertEqual([queue.get(), queue.get()], tasks[:2])
+
+        metrics = queue.metrics()
+        self.assertEqual(metrics['depth'], 1)
+        self.assertEqual(metrics['enqueued'], 3)
+        self.assertEqual(metrics['started'], 2)
+        self.assertGreaterEqual(metrics['max_wait_time'], metrics['average_wait_time'])
+
+    def test_cancel(self):
+        queue = TaskQueue()
+        task = DummyTask()
+        queue.put(task)
+
+        self.assertTrue(queue.cancel(task))
+        self.assertFalse(queue.cancel(task))
+        self.assertEqual(task.state, TaskState.CANCELLED)
+        self.assertIsNone(queue.get(timeout=0.01))
+
+    def test_yield_channel(self):
+        channel = YieldChannel()
+        self.assertIsNone(channel.pop(timeout=0.01))
+
+        channel.append(['preview', 1])
+        channel.append(['finish', 2])
+        self.assertEqual(len(channel), 2)
+        self.assertEqual(channel[0][0], 'preview')
+        self.assertEqual(channel.pop(), ['preview', 1])
+        self.assertEqual(channel.peek(), ['finish', 2])
+
+    def test_yield_channel_keeps_latest_preview(self):
+        channel = YieldChannel()
+        channel.append(['preview', 1])
+        channel.append(['results', 2])
+        channel.append(['preview', 3])
+        self.assertFalse(channel.preview_consumed())
+
+        self.assertEqual(channel.pop(), ['results', 2])
+        self.assertEqual(channel.pop(), ['preview', 3])
+        self.assertTrue(channel.preview_consumed())
+        self.assertIsNone(channel.pop(timeout=0.01))
+
+    def test_yield_channel_keeps_pending_preview_image(self):
+        channel = YieldChannel()
+        channel.append(['preview', (10, 'Sampling step 1', 'image')])
+        channel.append(['preview', (20, 'Sampling step 2', None)])
+        self.assertFalse(channel.preview_consumed())
+
+        self.assertEqual(channel.pop(), ['preview', (20, 'Sampling step 2', 'image')])
+        self.assertTrue(channel.preview_consumed())
+
+        channel.append(['preview', (30, 'Moving model to GPU ...', None)])
+        self.assertTrue(channel.preview_consumed())
+        channel.append(['preview', (40, 'Sampling step 4', 'image 2')])
+        self.assertEqual(channel.pop(), ['preview', (40, 'Sampling step 4', 'image 2')])
+
+    def test_affinity_scheduler_groups_models(self):
+        queue = TaskQueue(policy='affinity', fairness_window=4)
+        tasks = []
+        for name in ['a', 'b', 'a', 'b', 'a']:
+            task = DummyTask()
+            task.base_model_name = name
+            tasks.append(task)
+            queue.put(task)
+
+        order = [queue.get().base_model_name for _ in range(len(tasks))]
+        self.assertEqual(order, ['a', 'a', 'a', 'b', 'b'])
+        self.assertEqual(queue.metrics()['model_reloads'], 1)
+        self.assertEqual(queue.metrics()['reloads_saved'], 2)
+
+    def test_affinity_scheduler_fairness_window(self):
+        queue = TaskQueue(policy='affinity', fairness_window=1)
+        for name in ['a', 'b', 'a', 'a']:
+            task = DummyTask()
+            task.base_model_name = name
+            queue.put(task)
+
+        order = [queue.get().base_model_name for _ in range(4)]
+        self.assertEqual(order, ['a', 'a', 'b', 'a'])
+
+    def test_affinity_ignores_lora_weights(self):
+        queue = TaskQueue(policy='affinity', fairness_window=4)
+        for name, weight in [('a', 0.5), ('b', 1.0), ('a', 0.8)]:
+            task = DummyTask()
+            task.base_model_name = 'model'
+            task.loras = [(f'{name}.safetensors', weight)]
+            queue.put(task)
+
+        order = [queue.get().loras[0] for _ in range(3)]
+        self.assertEqual(order, [('a.safetensors', 0.5), ('a.safetensors', 0.8), ('b.safetensors', 1.0)])
+
+    def test_affinity_separates_vae(self):
+        queue = TaskQueue(policy='affinity', fairness_window=4)
+        for vae in ['a.safetensors', 'b.safetensors', 'a.safetensors']:
+            task = DummyTask()
+            task.base_model_name = 'model'
+            task.vae_name = vae
+            queue.put(task)
+
+        order = [queue.get().vae_name for _ in range(3)]
+        self.assertEqual(order, ['a.safetensors', 'a.safetensors', 'b.safetensors'])
+        self.assertEqual(queue.metrics()['model_reloads'], 1)
@@ -0,0 +1,39 @@
+import unittest
+
+import torch
+
+import ldm_patched.modules.utils
+from modules.upscaler import tiled_scale_images
+
+
+def upscale_2x(x):
+    return torch.nn.functional.interpolate(x, scale_factor=2, mode='bilinear', align_corners=False).sin()
+
+
+class TestTiledScaleImages(unittest.TestCase):
+    def test_matches_tiled_scale_per_image(self):
+        torch.manual_seed(0)
+        xs = [torch.rand(1, 3, 100, 140), torch.rand(1, 3, 64, 64), torch.rand(1, 3, 100, 140), torch.rand(1, 3, 37, 90)]
+        calls = []
+
+        def function(x):
+            calls.append(x.shape[0])
+            return upscale_2x(x)
+
+        ys = tiled_scale_images(xs, function, tile=64, overlap=8, scale=2, tile_batch_size=4)
+
+        self.assertEqual(len(ys), len(xs))
+        for x, y in zip(xs, ys):
+            expected = ldm_patched.modules.utils.tiled_scale(x, upscale_2x, tile_x=64, tile_y=64, overlap=8,
+                                                              upscale_amount=2)
+            self.assertEqual(y.shape, expected.shape)
+            self.assertEqual(y.device.type, 'cpu')
+            self.assertTrue(torch.allclose(y, expected, atol=1e-6))
+
+        # tiles of the same shape are shared between images
+        self.assertGreater(max(calls), 1)
+        self.assertLess(len(calls), sum(len(range(0, x.shape[2], 56)) * len(range(0, x.shape[3], 56)) for x in xs))
+
+
+if __name__ == '__main__':
+    unittest.main()
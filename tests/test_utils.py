@@ -1,6 +1,11 @@
 import os
+import random
+import re
+import tempfile
 import unittest
+from unittest import mock
 
+import modules.config
 import modules.flags
 from modules import util
 
@@ -135,3 +140,102 @@ class TestUtils(unittest.TestCase):
             expected = test["output"]
             actual = util.parse_lora_references_from_prompt(prompt, loras, loras_limit=loras_limit, lora_filenames=lora_filenames)
             self.assertEqual(expected, actual)
+
+
+def apply_wildcards_reference(wildcard_text, rng, i, read_wildcards_in_order):
+    """The expander before WildcardIndex, which read every wildcard file on each use."""
+    for _ in range(modules.config.wildcards_max_bfs_depth):
+        placeholders = re.findall(r'__([\w-]+)__', wildcard_text)
+        if len(placeholders) == 0:
+            return wildcard_text
+
+        for placeholder in placeholders:
+            try:
+                matches = [x for x in modules.config.wildcard_filenames if os.path.splitext(os.path.basename(x))[0] == placeholder]
+                words = open(os.path.join(modules.config.path_wildcards, matches[0]), encoding='utf-8').read().splitlines()
+                words = [x for x in words if x != '']
+                assert len(words) > 0
+                if read_wildcards_in_order:
+                    wildcard_text = wildcard_text.replace(f'__{placeholder}__', words[i % len(words)], 1)
+                else:
+                    wildcard_text = wildcard_text.replace(f'__{placeholder}__', rng.choice(words), 1)
+            except:
+                wildcard_text = wildcard_text.replace(f'__{placeholder}__', placeholder)
+    return wildcard_text
+
+
+class SequenceRng:
+    def __init__(self, indices):
+        self.indices = list(indices)
+
+    def choice(self, words):
+        return words[self.indices.pop(0)]
+
+
+class TestWildcards(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.temp_dir.cleanup)
+        self.filenames = []
+        for name, value in [('path_wildcards', self.temp_dir.name), ('wildcard_filenames', self.filenames),
+                            ('wildcards_max_bfs_depth', 64)]:
+            patcher = mock.patch.object(modules.config, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        patcher = mock.patch.object(util, 'wildcard_index', util.WildcardIndex())
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        self.write('color', 'red\ngreen\n\nblue\n')
+        self.write('animal', 'cat\ndog\nfox\nowl\n')
+        self.write('scene', '__color__ __animal__ in the snow\n__animal__ at night\n')
+
+    def write(self, name, content, mtime_ns=None):
+        path = os.path.join(self.temp_dir.name, f'{name}.txt')
+        with open(path, 'wb') as f:
+            f.write(content.encode('utf-8') if isinstance(content, str) else content)
+        if mtime_ns is not None:
+            os.utime(path, ns=(mtime_ns, mtime_ns))
+        if f'{name}.txt' not in self.filenames:
+            self.filenames.append(f'{name}.txt')
+
+    def test_same_rng_sequence_as_reference(self):
+        prompts = ['a __color__ __animal__, __scene__', 'a __animal__ and a __animal__', '__missing__ photo', 'no wildcards']
+        for seed in range(20):
+            expected_rng = random.Random(seed)
+            expected = [apply_wildcards_reference(p, expected_rng, seed, False) for p in prompts]
+
+            rng = random.Random(seed)
+            self.assertEqual(util.apply_wildcards_bulk(prompts, rng, seed, False), expected)
+            self.assertEqual(rng.getstate(), expected_rng.getstate())
+
+    def test_read_wildcards_in_order(self):
+        for i in range(6):
+            self.assertEqual(util.apply_wildcards('__color__ __animal__', random.Random(0), i, True),
+                             f"{['red', 'green', 'blue'][i % 3]} {['cat', 'dog', 'fox', 'owl'][i % 4]}")
+
+    def test_unreadable_file_falls_back_to_placeholder(self):
+        self.write('broken', b'\xff\xfe\xfa')
+        self.filenames.append('deleted.txt')
+        self.assertEqual(util.apply_wildcards('__broken__ __deleted__ __color__', SequenceRng([1]), 0, False),
+                         'broken deleted green')
+
+    def test_nested_placeholder_is_filled_one_level_later(self):
+        self.write('pair', '__animal__ and\n')
+        prompt = '__pair__ __animal__'
+
+        # the reference fills the nested __animal__ in place, before the later one of the same level
+        self.assertEqual(apply_wildcards_reference(prompt, SequenceRng([0, 0, 1]), 0, False), 'cat and dog')
+        self.assertEqual(util.apply_wildcards(prompt, SequenceRng([0, 0, 1]), 0, False), 'dog and cat')
+
+    def test_changed_file_is_read_again(self):
+        self.write('color', 'red\n', mtime_ns=1_000_000_000)
+        self.assertEqual(util.apply_wildcards('__color__', random.Random(0), 0, True), 'red')
+
+        checked = set()
+        self.assertEqual(util.apply_wildcards_bulk(['__color__'], random.Random(0), 0, True, checked), ['red'])
+        self.write('color', 'violet\n', mtime_ns=2_000_000_000)
+
+        # files already checked for this task are not checked again
+        self.assertEqual(util.apply_wildcards_bulk(['__color__'], random.Random(0), 1, True, checked), ['red'])
+        self.assertEqual(util.apply_wildcards('__color__', random.Random(0), 0, True), 'violet')
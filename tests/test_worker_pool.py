@@ -0,0 +1,69 @@
+import os
+import unittest
+
+from modules.task_queue import TaskQueue, YieldChannel
+from modules.worker_pool import WorkerPool, parse_devices
+
+
+def echo_serve(conn):
+    # stands in for serve_async_worker so the pool can be exercised without models
+    while True:
+        message = conn.recv()
+        kind, task_id = message[0], message[1]
+        if kind == 'shutdown':
+            return
+        if kind == 'task':
+            conn.send(('started', task_id))
+            conn.send(('yield', task_id, ('preview', (50, 'Sampling ...', None))))
+            state = dict(images_to_enhance_count=0, enhance_stats={}, should_enhance=False)
+            conn.send(('yield', task_id, ('finish', [os.getpid(), message[2]]), state))
+
+
+class DummyTask:
+    def __init__(self, args, base_model_name):
+        self.args = args
+        self.yields = YieldChannel()
+        self.results = []
+        self.base_model_name = base_model_name
+        self.refiner_model_name = 'None'
+        self.loras = []
+
+
+def wait_for_finish(task):
+    while True:
+        item = task.yields.pop(timeout=60)
+        assert item is not None, 'worker did not answer'
+        if item[0] == 'finish':
+            return item[1]
+
+
+class TestWorkerPool(unittest.TestCase):
+    def test_parse_devices(self):
+        self.assertEqual(parse_devices(None, 2), [None, None])
+        self.assertEqual(parse_devices('0,1', 3), ['0', '1', '0'])
+        self.assertEqual(parse_devices('cpu', 2), ['cpu', 'cpu'])
+
+    def test_tasks_run_in_separate_processes_with_affinity(self):
+        queue = TaskQueue()
+        pool = WorkerPool(queue, 2, devices='cpu', argv=[], serve_target='tests.test_worker_pool:echo_serve')
+        pool.start()
+        try:
+            self.assertTrue(pool.wait_ready(timeout=60))
+            first = DummyTask(['a'], 'model_a.safetensors')
+            second = DummyTask(['b'], 'model_b.safetensors')
+            queue.put(first)
+            queue.put(second)
+            pid_a, args_a = wait_for_finish(first)
+            pid_b, args_b = wait_for_finish(second)
+            self.assertEqual((args_a, args_b), (['a'], ['b']))
+            self.assertNotEqual(pid_a, os.getpid())
+            self.assertNotEqual(pid_a, pid_b)
+
+            # both workers are idle again, the task must go to the one that already has model_b
+            third = DummyTask(['c'], 'model_b.safetensors')
+            queue.put(third)
+            pid_c, _ = wait_for_finish(third)
+            self.assertEqual(pid_c, pid_b)
+            self.assertEqual(pool.metrics()['affinity_hits'], 1)
+        finally:
+            pool.shutdown()
@@ -127,42 +127,42 @@ def trigger_metadata_import(file, state_is_generating):
     worker.async_tasks.append(task)
 
     while not finished:
-        time.sleep(0.01)
-        if len(task.yields) > 0:
-            flag, product = task.yields.pop(0)
-            if flag == 'preview':
-
-                # help bad internet connection by skipping duplicated preview
-                if len(task.yields) > 0:  # if we have the next item
-                    if task.yields[0][0] == 'preview':   # if the next item is also a preview
-                        # print('Skipped one preview for better internet connection.')
-                        continue
-
-                percentage, title, image = product
-                yield gr.update(visible=True, value=modules.html.make_progress_html(percentage, title)), \
-                    gr.update(visible=True, value=image) if image is not None else gr.update(), \
-                    gr.update(), \
-                    gr.update(visible=False)
-            if flag == 'results':
-                yield gr.update(visible=True), \
-                    gr.update(visible=True), \
-                    gr.update(visible=True, value=product), \
-                    gr.update(visible=False)
-            if flag == 'finish':
-                if not args_manager.args.disable_enhance_output_sorting:
-                    product = sort_enhance_images(product, task)
-
-                yield gr.update(visible=False), \
-                    gr.update(visible=False), \
-                    gr.update(visible=False), \
-                    gr.update(visible=True, value=product)
-                finished = True
-
-                # delete Fooocus temp images, only keep gradio temp images
-                if args_manager.args.disable_image_log:
-                    for filepath in product:
-                        if isinstance(filepath, str) and os.path.exists(filepath):
-                            os.remove(filepath)
+        # blocks until the worker produces something, no polling
+        flag, product = task.yields.pop()
+        if flag == 'preview':
+
+            # help bad internet connection by skipping duplicated preview
+            next_item = task.yields.peek()
+            if next_item is not None:  # if we have the next item
+                if next_item[0] == 'preview':   # if the next item is also a preview
+                    # print('Skipped one preview for better internet connection.')
+                    continue
+
+            percentage, title, image = product
+            yield gr.update(visible=True, value=modules.html.make_progress_html(percentage, title)), \
+                gr.update(visible=True, value=image) if image is not None else gr.update(), \
+                gr.update(), \
+                gr.update(visible=False)
+        if flag == 'results':
+            yield gr.update(visible=True), \
+                gr.update(visible=True), \
+                gr.update(visible=True, value=product), \
+                gr.update(visible=False)
+        if flag == 'finish':
+            if not args_manager.args.disable_enhance_output_sorting:
+                product = sort_enhance_images(product, task)
+
+            yield gr.update(visible=False), \
+                gr.update(visible=False), \
+                gr.update(visible=False), \
+                gr.update(visible=True, value=product)
+            finished = True
+
+            # delete Fooocus temp images, only keep gradio temp images
+            if args_manager.args.disable_image_log:
+                for filepath in product:
+                    if isinstance(filepath, str) and os.path.exists(filepath):
+                        os.remove(filepath)
 
     execution_time = time.perf_counter() - execution_start_time
     print(f'Total time: {execution_time:.2f} seconds')
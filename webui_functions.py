@@ -196,43 +196,43 @@ def generate_clicked(task: worker.AsyncTask):
     worker.async_tasks.append(task)
 
     while not finished:
-        time.sleep(0.01)
-        if len(task.yields) > 0:
-            flag, product = task.yields.pop(0)
-            if flag == 'preview':
-
-                # help bad internet connection by skipping duplicated preview
-                if len(task.yields) > 0:  # if we have the next item
-                    if task.yields[0][0] == 'preview':   # if the next item is also a preview
-                        # print('Skipped one preview for better internet connection.')
-                        continue
-
-                percentage, title, image = product
-                yield gr.update(visible=True, value=modules.html.make_progress_html(percentage, title)), \
-                    gr.update(visible=True, value=image) if image is not None else gr.update(), \
-                    gr.update(), \
-                    gr.update(visible=False)
-            if flag == 'results':
-                finished_images = product
-                yield gr.update(visible=True), \
-                    gr.update(visible=True, value=finished_images[0]), \
-                    gr.update(visible=True, value=finished_images), \
-                    gr.update(visible=False)
-            if flag == 'finish':
-                if not args_manager.args.disable_enhance_output_sorting:
-                    product = sort_enhance_images(product, task)
-
-                yield gr.update(visible=False), \
-                    gr.update(visible=False), \
-                    gr.update(visible=False), \
-                    gr.update(visible=True, value=product)
-                finished = True
-
-                # delete Fooocus temp images, only keep gradio temp images
-                if args_manager.args.disable_image_log:
-                    for filepath in product:
-                        if isinstance(filepath, str) and os.path.exists(filepath):
-                            os.remove(filepath)
+        # blocks until the worker produces something, no polling
+        flag, product = task.yields.pop()
+        if flag == 'preview':
+
+            # help bad internet connection by skipping duplicated preview
+            next_item = task.yields.peek()
+            if next_item is not None:  # if we have the next item
+                if next_item[0] == 'preview':   # if the next item is also a preview
+                    # print('Skipped one preview for better internet connection.')
+                    continue
+
+            percentage, title, image = product
+            yield gr.update(visible=True, value=modules.html.make_progress_html(percentage, title)), \
+                gr.update(visible=True, value=image) if image is not None else gr.update(), \
+                gr.update(), \
+                gr.update(visible=False)
+        if flag == 'results':
+            finished_images = product
+            yield gr.update(visible=True), \
+                gr.update(visible=True, value=finished_images[0]), \
+                gr.update(visible=True, value=finished_images), \
+                gr.update(visible=False)
+        if flag == 'finish':
+            if not args_manager.args.disable_enhance_output_sorting:
+                product = sort_enhance_images(product, task)
+
+            yield gr.update(visible=False), \
+                gr.update(visible=False), \
+                gr.update(visible=False), \
+                gr.update(visible=True, value=product)
+            finished = True
+
+            # delete Fooocus temp images, only keep gradio temp images
+            if args_manager.args.disable_image_log:
+                for filepath in product:
+                    if isinstance(filepath, str) and os.path.exists(filepath):
+                        os.remove(filepath)
 
     execution_time = time.perf_counter() - execution_start_time
     print(f'Total time: {execution_time:.2f} seconds')
@@ -313,13 +313,20 @@ def inpaint_mode_change(mode, inpaint_engine_version):
 def stop_clicked(currentTask):
     import ldm_patched.modules.model_management as model_management
     currentTask.last_stop = 'stop'
+    if worker.worker_pool is not None and worker.worker_pool.interrupt(currentTask, 'stop'):
+        return currentTask
     if (currentTask.processing):
         model_management.interrupt_current_processing()
+    elif worker.async_tasks.cancel(currentTask):
+        # never reached the worker, release the waiting generate_clicked loop
+        currentTask.yields.append(['finish', currentTask.results])
     return currentTask
 
 def skip_clicked(currentTask):
     import ldm_patched.modules.model_management as model_management
     currentTask.last_stop = 'skip'
+    if worker.worker_pool is not None and worker.worker_pool.interrupt(currentTask, 'skip'):
+        return currentTask
     if (currentTask.processing):
         model_management.interrupt_current_processing()
     return currentTask
@@ -385,7 +392,7 @@ def dev_mode_checked(r):
     return gr.update(visible=r)
 
 def refresh_files_clicked():
-    modules.config.update_files()
+    modules.config.refresh_files()
     results = [gr.update(choices=modules.config.model_filenames)]
     results += [gr.update(choices=['None'] + modules.config.model_filenames)]
     results += [gr.update(choices=[flags.default_vae] + modules.config.vae_filenames)]